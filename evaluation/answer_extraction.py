@@ -33,6 +33,25 @@ TASK_MAPPING = {
 # 类别定义
 categories_zh = ["体育", "健康", "地理", "娱乐", "政治", "旅游", "科技"]
 
+# 选项字母 -> 位掩码（支持大小写）
+CHOICE_LETTER_BITS = {
+    'A': 1, 'B': 2, 'C': 4, 'D': 8,
+    'a': 1, 'b': 2, 'c': 4, 'd': 8,
+}
+
+# 位掩码 -> 标准化答案（A-D 的全部 16 种组合，已排序去重）
+CHOICE_MASK_TO_ANSWER = (
+    '', 'A', 'B', 'AB', 'C', 'AC', 'BC', 'ABC',
+    'D', 'AD', 'BD', 'ABD', 'CD', 'ACD', 'BCD', 'ABCD',
+)
+
+# 兜底扫描时只检查文本末尾的字符数（模型通常在结尾给出答案）
+ANSWER_TAIL_LEN = 512
+
+CHOICE_LETTER_PATTERN = re.compile(r'[A-Da-d]')
+NUMBER_PATTERN = re.compile(r'\d+(?:\.\d+)?')
+NON_NUMBER_CHAR_PATTERN = re.compile(r'[^\d.]')
+
 def extract_answer_for_choice_question(item):
     """
     提取选择题的答案（单选和多选，A/B/C/D，支持大小写和多种格式）
@@ -119,8 +138,9 @@ def extract_choice_from_text(text):
             choice = matches[-1].upper()
             return choice
     
-    # 最后尝试提取所有可能的字母并判断
-    all_letters = re.findall(r'[A-Da-d]', text)
+    # 最后尝试提取所有可能的字母并判断（只扫描文本末尾）
+    tail = text if len(text) <= ANSWER_TAIL_LEN else text[-ANSWER_TAIL_LEN:]
+    all_letters = CHOICE_LETTER_PATTERN.findall(tail)
     if all_letters:
         # 转换为大写并去重
         unique_letters = list(dict.fromkeys([letter.upper() for letter in all_letters]))
@@ -144,7 +164,7 @@ def extract_letters_from_choice_text(choice_text):
         字母列表
     """
     # 提取所有A-D字母（大小写）
-    letters = re.findall(r'[A-Da-d]', choice_text)
+    letters = CHOICE_LETTER_PATTERN.findall(choice_text)
     
     # 转换为大写并去重，保持顺序
     unique_letters = []
@@ -167,14 +187,12 @@ def normalize_choice_answer(letters):
     返回:
         标准化的答案字符串，如 "ABC"
     """
-    if not letters:
-        return ""
-    
-    # 去重并排序
-    unique_letters = sorted(set(letter.upper() for letter in letters))
+    # 按位记录出现的选项，再查表得到排序去重后的答案
+    mask = 0
+    for letter in letters:
+        mask |= CHOICE_LETTER_BITS.get(letter, 0)
     
-    # 返回连接的字符串
-    return ''.join(unique_letters)
+    return CHOICE_MASK_TO_ANSWER[mask]
 
 def extract_answer_for_question_answering(item):
     """
@@ -238,7 +256,7 @@ def extract_answer_for_math_reasoning(item):
     pred = item.get('pred', '')
     
     # 查找第一个出现的数字
-    number_match = re.search(r'\d+(?:\.\d+)?', pred)
+    number_match = NUMBER_PATTERN.search(pred)
     if number_match:
         return number_match.group(0), True
         
@@ -250,14 +268,33 @@ def extract_answer_for_math_reasoning(item):
         content = message.get('content', '')
         
         if content:
-            # 查找所有数字，返回最后一个
-            number_matches = re.findall(r'\d+(?:\.\d+)?', content)
-            if number_matches:
-                return number_matches[-1], True
+            # 查找最后一个数字
+            last_number = find_last_number(content)
+            if last_number is not None:
+                return last_number, True
     
     # 没有找到任何匹配项
     return "none", False
 
+def find_last_number(text):
+    """
+    查找文本中的最后一个数字，优先只扫描文本末尾，末尾没有数字时再扫描全文
+    
+    返回:
+        最后一个数字字符串，没有数字时返回None
+    """
+    tail_start = len(text) - ANSWER_TAIL_LEN
+    if tail_start > 0:
+        # 从末尾窗口内第一个非数字字符开始扫描，避免截断跨越窗口边界的数字
+        boundary = NON_NUMBER_CHAR_PATTERN.search(text, tail_start)
+        if boundary:
+            number_matches = NUMBER_PATTERN.findall(text, boundary.start())
+            if number_matches:
+                return number_matches[-1]
+    
+    number_matches = NUMBER_PATTERN.findall(text)
+    return number_matches[-1] if number_matches else None
+
 def process_result_file(file_path, task_name):
     """
     处理结果文件，提取标准答案和预测答案，同时统计失败数和记录失败ID
@@ -1,4 +1,5 @@
 import json
+import re
 import time
 import argparse
 import os
@@ -135,17 +136,26 @@ TASK_MAPPING = {
 # 反向映射：代码中的任务名称 -> 新的目录结构
 REVERSE_TASK_MAPPING = {v: k for k, v in TASK_MAPPING.items()}
 
+# 缺少metadata时使用的空字典（只读，不要修改）
+EMPTY_METADATA = {}
 
+# 选项字母："A"、"B"、"C"……
+OPTION_LETTERS = tuple(chr(65 + i) for i in range(26))
+
+# 选项编号前缀："A. "、"B. "、"C. "……
+OPTION_PREFIXES = tuple(f"{letter}. " for letter in OPTION_LETTERS)
+
+def format_options(options):
+    """将选项列表格式化为 "A. xxx B. yyy " 形式的文本"""
+    return "".join([f"{OPTION_PREFIXES[j]}{option} " for j, option in enumerate(options)])
+
+
+# special tokens to strip from the output, matched in a single pass
+SPECIAL_TOKEN_PATTERN = re.compile(r'<pad>|</?s>|<unk>|<extra_id_0>')
 
 # remove special tokens in the output
 def remove_special_tokens(text):
-    text = text.replace('<pad>', '')
-    text = text.replace('<s>', '')
-    text = text.replace('</s>', '')
-    text = text.replace('<unk>', '')
-    text = text.replace('<extra_id_0>', '')
-    text = text.strip()
-    return text
+    return SPECIAL_TOKEN_PATTERN.sub('', text).strip()
 
 
 def convert_dataset_into_prompt_ethnic_domain_knowledge(input_dataset, exemplar_dataset=None, eval_lang='bo', num_exemplar=3, prompt_lang='zh'):
@@ -169,13 +179,10 @@ def convert_dataset_into_prompt_ethnic_domain_knowledge(input_dataset, exemplar_
         for i in range(min(num_exemplar, len(exemplar_dataset))):
             example = exemplar_dataset[i]
             # 处理选项，添加A、B、C、D等编号
-            options_text = ""
-            for j, option in enumerate(example['option']):
-                option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-                options_text += f"{option_label}. {option} "
+            options_text = format_options(example['option'])
             
             # 获取题型
-            question_type = example.get('metadata', {}).get('type', '单选题')
+            question_type = (example.get('metadata') or EMPTY_METADATA).get('type', '单选题')
             
             if prompt_lang == 'en':
                 if question_type == '多选题':
@@ -205,19 +212,14 @@ def convert_dataset_into_prompt_ethnic_domain_knowledge(input_dataset, exemplar_
         qid = item['id']
 
         # 根据metadata中的language字段获取语言
-        if 'metadata' in item and 'language' in item['metadata']:
-            lang = item['metadata']['language']
-        else:
-            lang = eval_lang
+        meta = item.get('metadata') or EMPTY_METADATA
+        lang = meta.get('language', eval_lang)
             
         # 获取题型
-        question_type = item.get('metadata', {}).get('type', '单选题')
+        question_type = meta.get('type', '单选题')
             
         # 处理选项，添加A、B、C、D等编号
-        options_text = ""
-        for j, option in enumerate(item['option']):
-            option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-            options_text += f"{option_label}. {option} "
+        options_text = format_options(item['option'])
             
         prompt = prompt_prefix
         if prompt_lang == 'en':
@@ -339,10 +341,7 @@ def convert_dataset_into_prompt_coref_resolution(input_dataset, exemplar_dataset
         for i in range(min(num_exemplar, len(exemplar_dataset))):
             example = exemplar_dataset[i]
             # 处理选项，添加A、B等编号
-            options_text = ""
-            for j, option in enumerate(example['option']):
-                option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-                options_text += f"{option_label}. {option} "
+            options_text = format_options(example['option'])
             
             # 从answer字段获取示例答案（如果存在）
             example_answer = example.get('answer', None)
@@ -351,7 +350,7 @@ def convert_dataset_into_prompt_coref_resolution(input_dataset, exemplar_dataset
                 if isinstance(example['label'], bool):
                     label_str = str(example['label']).lower()
                     correct_index = example['option'].index(label_str)
-                    example_answer = chr(65 + correct_index)
+                    example_answer = OPTION_LETTERS[correct_index]
                 else:
                     example_answer = example['label']
             
@@ -375,16 +374,11 @@ def convert_dataset_into_prompt_coref_resolution(input_dataset, exemplar_dataset
         qid = item['id']
 
         # 根据metadata中的language字段获取语言
-        if 'metadata' in item and 'language' in item['metadata']:
-            lang = item['metadata']['language']
-        else:
-            lang = eval_lang
+        meta = item.get('metadata') or EMPTY_METADATA
+        lang = meta.get('language', eval_lang)
             
         # 处理选项，添加A、B等编号
-        options_text = ""
-        for j, option in enumerate(item['option']):
-            option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-            options_text += f"{option_label}. {option} "
+        options_text = format_options(item['option'])
             
         prompt = prompt_prefix
         if prompt_lang == 'en':
@@ -413,7 +407,7 @@ def convert_dataset_into_prompt_coref_resolution(input_dataset, exemplar_dataset
                 # 获取该字符串在选项中的索引
                 correct_index = item['option'].index(label_str)
                 # 转换为对应的字母
-                gold = chr(65 + correct_index)
+                gold = OPTION_LETTERS[correct_index]
             else:
                 # 如果标签已经是字母形式，直接使用
                 gold = item['label']
@@ -456,6 +450,8 @@ def convert_dataset_into_prompt_entailment(input_dataset, exemplar_dataset=None,
         'neutral': 'neutral'
     }
 
+    label_map = label_map_zh if prompt_lang == 'zh' else label_map_en
+
     # 清理数据中键的空格
     def clean_item_keys(item):
         cleaned_item = {}
@@ -476,18 +472,14 @@ def convert_dataset_into_prompt_entailment(input_dataset, exemplar_dataset=None,
             example = cleaned_exemplar_dataset[i]
             
             # 处理选项，添加A、B、C等编号
-            options_text = ""
-            for j, option in enumerate(example['option']):
-                option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-                option_text = label_map_zh[option] if prompt_lang == 'zh' else label_map_en[option]
-                options_text += f"{option_label}. {option_text} "
+            options_text = format_options([label_map[option] for option in example['option']])
             
             # 获取示例答案（优先使用answer字段）
             example_answer = example.get('answer', None)
             if example_answer is None:
                 # 如果answer字段不存在，则从label生成答案
                 correct_index = example['option'].index(example['label'])
-                example_answer = chr(65 + correct_index)
+                example_answer = OPTION_LETTERS[correct_index]
             
             if prompt_lang == 'en':
                 prompt_prefix += f"Please determine the relationship between the following two {abbr_to_lang_en[eval_lang]} sentences.\n"
@@ -507,17 +499,11 @@ def convert_dataset_into_prompt_entailment(input_dataset, exemplar_dataset=None,
         qid = item['id']
 
         # 根据metadata中的language字段获取语言
-        if 'metadata' in item and 'language' in item['metadata']:
-            lang = item['metadata']['language']
-        else:
-            lang = eval_lang
+        meta = item.get('metadata') or EMPTY_METADATA
+        lang = meta.get('language', eval_lang)
             
         # 处理选项，添加A、B、C等编号
-        options_text = ""
-        for j, option in enumerate(item['option']):
-            option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-            option_text = label_map_zh[option] if prompt_lang == 'zh' else label_map_en[option]
-            options_text += f"{option_label}. {option_text} "
+        options_text = format_options([label_map[option] for option in item['option']])
             
         prompt = prompt_prefix
         if prompt_lang == 'en':
@@ -539,7 +525,7 @@ def convert_dataset_into_prompt_entailment(input_dataset, exemplar_dataset=None,
         else:
             # 如果没有answer字段，则从label生成答案
             correct_index = item['option'].index(item['label'])
-            gold = chr(65 + correct_index)
+            gold = OPTION_LETTERS[correct_index]
             
         converted_dataset.append({
             "id": qid,
@@ -583,10 +569,8 @@ def convert_dataset_into_prompt_tokenization(input_dataset, exemplar_dataset=Non
         qid = item['id']
 
         # 根据metadata中的language字段获取语言
-        if 'metadata' in item and 'language' in item['metadata']:
-            lang = item['metadata']['language']
-        else:
-            lang = eval_lang
+        meta = item.get('metadata') or EMPTY_METADATA
+        lang = meta.get('language', eval_lang)
             
         prompt = prompt_prefix
         if prompt_lang == 'en':
@@ -654,10 +638,8 @@ def convert_dataset_into_prompt_text_classification(input_dataset, exemplar_data
         qid = item['id']
 
         # 根据metadata中的language字段获取语言
-        if 'metadata' in item and 'language' in item['metadata']:
-            lang = item['metadata']['language']
-        else:
-            lang = eval_lang
+        meta = item.get('metadata') or EMPTY_METADATA
+        lang = meta.get('language', eval_lang)
             
         prompt = prompt_prefix
         if prompt_lang == 'en':
@@ -722,10 +704,8 @@ def convert_dataset_into_prompt_reading_comprehension(input_dataset, exemplar_da
         qid = item['query_id'] if 'query_id' in item else item['id']
 
         # 根据metadata中的language字段获取语言
-        if 'metadata' in item and 'language' in item['metadata']:
-            lang = item['metadata']['language']
-        else:
-            lang = eval_lang
+        meta = item.get('metadata') or EMPTY_METADATA
+        lang = meta.get('language', eval_lang)
             
         prompt = prompt_prefix
         if prompt_lang == 'en':
@@ -768,10 +748,7 @@ def convert_dataset_into_prompt_safety(input_dataset, exemplar_dataset=None, eva
         for i in range(min(num_exemplar, len(exemplar_dataset))):
             example = exemplar_dataset[i]
             # 处理选项，添加A、B、C、D等编号
-            options_text = ""
-            for j, option in enumerate(example['option']):
-                option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-                options_text += f"{option_label}. {option} "
+            options_text = format_options(example['option'])
             
             if prompt_lang == 'en':
                 prompt_prefix += f"Please answer the following {abbr_to_lang_en[eval_lang]} question by selecting the correct option.\n"
@@ -789,16 +766,11 @@ def convert_dataset_into_prompt_safety(input_dataset, exemplar_dataset=None, eva
         qid = item['id']
 
         # 根据metadata中的language字段获取语言
-        if 'metadata' in item and 'language' in item['metadata']:
-            lang = item['metadata']['language']
-        else:
-            lang = eval_lang
+        meta = item.get('metadata') or EMPTY_METADATA
+        lang = meta.get('language', eval_lang)
             
         # 处理选项，添加A、B、C、D等编号
-        options_text = ""
-        for j, option in enumerate(item['option']):
-            option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-            options_text += f"{option_label}. {option} "
+        options_text = format_options(item['option'])
             
         prompt = prompt_prefix
         if prompt_lang == 'en':
@@ -841,10 +813,7 @@ def convert_dataset_into_prompt_professional_skills(input_dataset, exemplar_data
         for i in range(min(num_exemplar, len(exemplar_dataset))):
             example = exemplar_dataset[i]
             # 处理选项，添加A、B、C、D等编号
-            options_text = ""
-            for j, option in enumerate(example['option']):
-                option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-                options_text += f"{option_label}. {option} "
+            options_text = format_options(example['option'])
             
             if prompt_lang == 'en':
                 prompt_prefix += f"Please answer the following {abbr_to_lang_en[eval_lang]} professional knowledge question by selecting the correct option.\n"
@@ -862,22 +831,18 @@ def convert_dataset_into_prompt_professional_skills(input_dataset, exemplar_data
         qid = item['id']
 
         # 根据metadata中的language字段获取语言
-        if 'metadata' in item and 'language' in item['metadata']:
-            lang = item['metadata']['language']
-        else:
-            lang = eval_lang
+        meta = item.get('metadata') or EMPTY_METADATA
+        lang = meta.get('language', eval_lang)
             
         # 处理选项，添加A、B、C、D等编号
-        options_text = ""
-        for j, option in enumerate(item['option']):
-            option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-            options_text += f"{option_label}. {option} "
+        options_text = format_options(item['option'])
             
         # 获取专业领域信息（如果存在）
         domain_info = ""
-        if 'task' in item and 'domain' in item['task']:
-            domain = item['task']['domain']
-            sub_domain = item['task'].get('sub_domain', '')
+        task_info = item.get('task') or {}
+        if 'domain' in task_info:
+            domain = task_info['domain']
+            sub_domain = task_info.get('sub_domain', '')
             
             if prompt_lang == 'en':
                 domain_info = f" (Domain: {domain}, Sub-domain: {sub_domain})" if sub_domain else f" (Domain: {domain})"
@@ -925,10 +890,7 @@ def convert_dataset_into_prompt_traditional_proverbs(input_dataset, exemplar_dat
         for i in range(min(num_exemplar, len(exemplar_dataset))):
             example = exemplar_dataset[i]
             # 处理选项，添加A、B、C、D等编号
-            options_text = ""
-            for j, option in enumerate(example['option']):
-                option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-                options_text += f"{option_label}. {option} "
+            options_text = format_options(example['option'])
             
             if prompt_lang == 'en':
                 prompt_prefix += f"Please select the Chinese proverb that corresponds to the following {abbr_to_lang_en[eval_lang]} traditional proverb.\n"
@@ -946,16 +908,11 @@ def convert_dataset_into_prompt_traditional_proverbs(input_dataset, exemplar_dat
         qid = item['id']
 
         # 根据metadata中的language字段获取语言
-        if 'metadata' in item and 'language' in item['metadata']:
-            lang = item['metadata']['language']
-        else:
-            lang = eval_lang
+        meta = item.get('metadata') or EMPTY_METADATA
+        lang = meta.get('language', eval_lang)
             
         # 处理选项，添加A、B、C、D等编号
-        options_text = ""
-        for j, option in enumerate(item['option']):
-            option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-            options_text += f"{option_label}. {option} "
+        options_text = format_options(item['option'])
             
         prompt = prompt_prefix
         if prompt_lang == 'en':
@@ -998,10 +955,7 @@ def convert_dataset_into_prompt_ethnic_vocabulary(input_dataset, exemplar_datase
         for i in range(min(num_exemplar, len(exemplar_dataset))):
             example = exemplar_dataset[i]
             # 处理选项，添加A、B、C、D等编号
-            options_text = ""
-            for j, option in enumerate(example['option']):
-                option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-                options_text += f"{option_label}. {option} "
+            options_text = format_options(example['option'])
             
             if prompt_lang == 'en':
                 prompt_prefix += f"Please select the Chinese term that corresponds to the {abbr_to_lang_en[eval_lang]} ethnic vocabulary term in the question.\n"
@@ -1019,16 +973,11 @@ def convert_dataset_into_prompt_ethnic_vocabulary(input_dataset, exemplar_datase
         qid = item['id']
 
         # 根据metadata中的language字段获取语言
-        if 'metadata' in item and 'language' in item['metadata']:
-            lang = item['metadata']['language']
-        else:
-            lang = eval_lang
+        meta = item.get('metadata') or EMPTY_METADATA
+        lang = meta.get('language', eval_lang)
             
         # 处理选项，添加A、B、C、D等编号
-        options_text = ""
-        for j, option in enumerate(item['option']):
-            option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-            options_text += f"{option_label}. {option} "
+        options_text = format_options(item['option'])
             
         prompt = prompt_prefix
         if prompt_lang == 'en':
@@ -1084,10 +1033,8 @@ def convert_dataset_into_prompt_math_reasoning(input_dataset, exemplar_dataset=N
         qid = item['id']
 
         # 根据metadata中的language字段获取语言
-        if 'metadata' in item and 'language' in item['metadata']:
-            lang = item['metadata']['language']
-        else:
-            lang = eval_lang
+        meta = item.get('metadata') or EMPTY_METADATA
+        lang = meta.get('language', eval_lang)
             
         prompt = prompt_prefix
         if prompt_lang == 'en':
@@ -1154,10 +1101,8 @@ def convert_dataset_into_prompt_traditional_culture(input_dataset, exemplar_data
         qid = item['id']
 
         # 根据metadata中的language字段获取语言
-        if 'metadata' in item and 'language' in item['metadata']:
-            lang = item['metadata']['language']
-        else:
-            lang = eval_lang
+        meta = item.get('metadata') or EMPTY_METADATA
+        lang = meta.get('language', eval_lang)
             
         prompt = prompt_prefix
         if prompt_lang == 'en':
@@ -1224,10 +1169,8 @@ def convert_dataset_into_prompt_text_generation(input_dataset, exemplar_dataset=
         qid = item['id']
 
         # 根据metadata中的language字段获取语言
-        if 'metadata' in item and 'language' in item['metadata']:
-            lang = item['metadata']['language']
-        else:
-            lang = eval_lang
+        meta = item.get('metadata') or EMPTY_METADATA
+        lang = meta.get('language', eval_lang)
             
         prompt = prompt_prefix
         if prompt_lang == 'en':
@@ -1268,10 +1211,7 @@ def convert_dataset_into_prompt_ethnic_language_understanding(input_dataset, exe
         for i in range(min(num_exemplar, len(exemplar_dataset))):
             example = exemplar_dataset[i]
             # 处理选项，添加A、B、C等编号
-            options_text = ""
-            for j, option in enumerate(example['option']):
-                option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-                options_text += f"{option_label}. {option} "
+            options_text = format_options(example['option'])
             
             if prompt_lang == 'en':
                 prompt_prefix += f"Please answer the following {abbr_to_lang_en[eval_lang]} ethnic language understanding question by selecting the correct option.\n"
@@ -1289,16 +1229,11 @@ def convert_dataset_into_prompt_ethnic_language_understanding(input_dataset, exe
         qid = item['id']
 
         # 根据metadata中的language字段获取语言
-        if 'metadata' in item and 'language' in item['metadata']:
-            lang = item['metadata']['language']
-        else:
-            lang = eval_lang
+        meta = item.get('metadata') or EMPTY_METADATA
+        lang = meta.get('language', eval_lang)
             
         # 处理选项，添加A、B、C等编号
-        options_text = ""
-        for j, option in enumerate(item['option']):
-            option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-            options_text += f"{option_label}. {option} "
+        options_text = format_options(item['option'])
             
         prompt = prompt_prefix
         if prompt_lang == 'en':
@@ -1,13 +1,20 @@
-import json
+import re
 import time
 import argparse
 import os
 import signal
 import sys
+import multiprocessing
+import itertools
 from tqdm import tqdm
 import torch
 import traceback
 from datetime import datetime
+from dataclasses import dataclass, asdict, fields
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Optional
+import orjson
 from vllm import LLM, SamplingParams
 
 # 创建一个记录错误的函数
@@ -38,22 +45,32 @@ def log_error(error_file, error_id_file, message, error, item_ids=None):
             # 读取现有ID（如果文件存在）
             existing_ids = []
             if os.path.exists(error_id_file):
-                with open(error_id_file, 'r', encoding='utf-8') as f:
-                    existing_ids = json.load(f)
+                with open(error_id_file, 'rb') as f:
+                    existing_ids = orjson.loads(f.read())
             
-            # 添加新的ID
+            # 添加新的ID（用集合判重，保持原有顺序）
+            seen_ids = set(existing_ids)
             for item_id in item_ids:
-                if item_id not in existing_ids:
+                if item_id not in seen_ids:
                     existing_ids.append(item_id)
+                    seen_ids.add(item_id)
             
             # 写回文件
-            with open(error_id_file, 'w', encoding='utf-8') as f:
-                json.dump(existing_ids, f, indent=4, ensure_ascii=False)
+            with open(error_id_file, 'wb') as f:
+                f.write(orjson.dumps(existing_ids, option=orjson.OPT_INDENT_2))
             
             print(f"已将{len(item_ids)}个错误ID保存到 {error_id_file}")
         except Exception as e:
             print(f"保存错误ID时发生异常: {str(e)}")
 
+def log_global_error(error_log_file, message, error):
+    """记录错误到全局错误日志"""
+    with open(error_log_file, 'a', encoding='utf-8') as f:
+        f.write(f"=== {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
+        f.write(f"{message}: {str(error)}\n")
+        f.write(f"堆栈跟踪:\n{traceback.format_exc()}\n\n")
+    print(f"{message}: {str(error)}")
+
 def signal_handler(sig, frame):
     """处理中断信号"""
     print("\n捕获到中断信号，正在退出...")
@@ -64,18 +81,35 @@ def save_results(results, output_file):
     # 保存到临时文件，然后重命名，避免保存过程中断导致文件损坏
     temp_file = output_file + ".tmp"
     try:
-        with open(temp_file, 'w', encoding='utf-8') as f:
-            json.dump(results, f, indent=4, ensure_ascii=False)
+        # orjson直接输出UTF-8字节，无需ensure_ascii
+        with open(temp_file, 'wb') as f:
+            f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE))
         
-        # 替换原文件
-        if os.path.exists(output_file):
-            os.remove(output_file)
-        os.rename(temp_file, output_file)
+        # 原子地替换原文件
+        os.replace(temp_file, output_file)
         print(f"已保存{len(results)}条结果到{output_file}")
         return True
     except Exception as e:
         print(f"保存结果时出错: {str(e)}")
         return False
+
+def write_results_jsonl(f, new_items, sync=False):
+    """将新结果逐条追加到已打开的JSONL文件，sync为True时同时落盘"""
+    f.write(b"".join(orjson.dumps(item) + b"\n" for item in new_items))
+    f.flush()
+    if sync:
+        os.fsync(f.fileno())
+
+def load_results_jsonl(output_file_jsonl):
+    """读取JSONL结果文件，跳过中断时只写了一半的行"""
+    results = []
+    with open(output_file_jsonl, 'rb') as f:
+        for line in f:
+            try:
+                results.append(orjson.loads(line))
+            except orjson.JSONDecodeError:
+                continue
+    return results
         
 abbr_to_lang_en = {
     "zh": "Chinese",
@@ -122,15 +156,355 @@ TASK_MAPPING = {
 # 反向映射：代码中的任务名称 -> 新的目录结构
 REVERSE_TASK_MAPPING = {v: k for k, v in TASK_MAPPING.items()}
 
+# 缺少metadata时使用的空字典（只读，不要修改）
+EMPTY_METADATA = {}
+
+# 选项字母："A"、"B"、"C"……
+OPTION_LETTERS = tuple(chr(65 + i) for i in range(26))
+
+# 选项编号前缀："A. "、"B. "、"C. "……
+OPTION_PREFIXES = tuple(f"{letter}. " for letter in OPTION_LETTERS)
+
+# 提示语言 -> 语言名称表
+LANG_NAMES = {
+    'en': abbr_to_lang_en,
+    'zh': abbr_to_lang_zh,
+}
+
+# 预先定义的提示模板：(任务, 提示语言) -> 模板
+# query 为待回答样本的模板，exemplar 为示例模板（未给出时为 query 加上答案），hints 为按语言附加的提示
+PROMPT_TEMPLATES = {
+    ('ethnic_domain_knowledge', 'en'): {
+        'query': (
+            "Please answer the following {lang} ethnic domain knowledge single-choice question by selecting the correct option.\n"
+            "Question: {question}\n"
+            "Options: {options}\n"
+            "Answer (just provide the letter of the option, e.g. A, B, C, etc.): "
+        ),
+        'query_multiple': (
+            "Please answer the following {lang} ethnic domain knowledge multiple-choice question by selecting the correct options.\n"
+            "Question: {question}\n"
+            "Options: {options}\n"
+            "Answer (provide all correct option letters, e.g. A, BC, ABC, etc.): "
+        ),
+        'exemplar_multiple': (
+            "Please answer the following {lang} ethnic domain knowledge multiple-choice question by selecting the correct options.\n"
+            "Question: {question}\n"
+            "Options: {options}\n"
+            "Answer (just provide all correct option letters, e.g. A, BC, ABC, etc.): {answer}\n\n"
+        ),
+    },
+    ('ethnic_domain_knowledge', 'zh'): {
+        'query': (
+            "请回答以下{lang}民族领域知识单选题，选择正确的选项。\n"
+            "问题：{question}\n"
+            "选项：{options}\n"
+            "答案（只需提供选项字母，如A、B、C等，不需要提供额外的解释）："
+        ),
+        'query_multiple': (
+            "请回答以下{lang}民族领域知识多选题，选择所有正确的选项。\n"
+            "问题：{question}\n"
+            "选项：{options}\n"
+            "答案（只需提供所有正确选项字母，如A、BC、ABC等，不需要提供额外的解释）："
+        ),
+    },
+    ('safety', 'en'): {
+        'query': (
+            "Please answer the following {lang} question by selecting the correct option.\n"
+            "Question: {question}\n"
+            "Options: {options}\n"
+            "Answer (just provide the letter of the option, e.g. A, B, C, etc.): "
+        ),
+    },
+    ('safety', 'zh'): {
+        'query': (
+            "请回答以下{lang}问题，选择正确的选项。\n"
+            "问题：{question}\n"
+            "选项：{options}\n"
+            "答案（只需提供选项字母，如A、B、C等）："
+        ),
+    },
+    ('professional_skills', 'en'): {
+        'query': (
+            "Please answer the following {lang} professional knowledge question{domain_info} by selecting the correct option.\n"
+            "Question: {question}\n"
+            "Options: {options}\n"
+            "Answer (just provide the letter of the option, e.g. A, B, C, etc.): "
+        ),
+        'domain': " (Domain: {domain})",
+        'domain_sub': " (Domain: {domain}, Sub-domain: {sub_domain})",
+    },
+    ('professional_skills', 'zh'): {
+        'query': (
+            "请回答以下{lang}专业知识问题{domain_info}，选择正确的选项。\n"
+            "问题：{question}\n"
+            "选项：{options}\n"
+            "答案（只需提供选项字母，如A、B、C等）："
+        ),
+        'domain': "（领域：{domain}）",
+        'domain_sub': "（领域：{domain}，子领域：{sub_domain}）",
+    },
+    ('ethnic_vocabulary', 'en'): {
+        'query': (
+            "Please select the Chinese term that corresponds to the {lang} ethnic vocabulary term in the question.\n"
+            "Question: {question}\n"
+            "Options: {options}\n"
+            "Answer (just provide the letter of the option, e.g. A, B, C, etc.): "
+        ),
+    },
+    ('ethnic_vocabulary', 'zh'): {
+        'query': (
+            "请选择与问题中的词汇术语对应的{lang}术语。\n"
+            "问题：{question}\n"
+            "选项：{options}\n"
+            "答案（只需提供选项字母，如A、B、C等）："
+        ),
+    },
+    ('ethnic_language_understanding', 'en'): {
+        'query': (
+            "Please answer the following {lang} ethnic language understanding question by selecting the correct option.\n"
+            "Question: {question}\n"
+            "Options: {options}\n"
+            "Answer (just provide the letter of the option, e.g. A, B, C): "
+        ),
+    },
+    ('ethnic_language_understanding', 'zh'): {
+        'query': (
+            "请回答以下{lang}民族语言理解问题，选择正确的选项。\n"
+            "问题：{question}\n"
+            "选项：{options}\n"
+            "答案（只需提供选项字母，如A、B、C）："
+        ),
+    },
+    ('translation', 'en'): {
+        'query': (
+            "Please translate the following {src} text into {tgt}. {hint}\n"
+            "{src}: {text}\n"
+            "{tgt}: "
+        ),
+        'hints': {
+            'bo': "",
+            'mn': "Please translate into traditional Mongolian script (vertical Mongolian script).",
+            'ug': ""
+        },
+    },
+    ('translation', 'zh'): {
+        'query': (
+            "请将下面的{src}文本翻译成{tgt}。{hint}\n"
+            "{src}：{text}\n"
+            "{tgt}："
+        ),
+        'hints': {
+            'bo': "",
+            'mn': "请使用传统蒙古文(竖写蒙古文)进行翻译。",
+            'ug': ""
+        },
+    },
+    ('coref_resolution', 'en'): {
+        'query': (
+            "Please determine if the two spans in the following {lang} text refer to the same entity.\n"
+            "Text: {text}\n"
+            "Span 1: {span1}\n"
+            "Span 2: {span2}\n"
+            "Options: {options}\n"
+            "Answer (just provide the letter of the option, e.g. A, B): "
+        ),
+    },
+    ('coref_resolution', 'zh'): {
+        'query': (
+            "请判断以下{lang}文本中的两个片段是否指代同一个实体。\n"
+            "文本：{text}\n"
+            "片段1：{span1}\n"
+            "片段2：{span2}\n"
+            "选项：{options}\n"
+            "答案（只需提供选项字母，如A、B）："
+        ),
+    },
+    ('entailment', 'en'): {
+        'query': (
+            "Please determine the relationship between the following two {lang} sentences.\n"
+            "Sentence 1: {sentence1}\n"
+            "Sentence 2: {sentence2}\n"
+            "Options: {options}\n"
+            "Answer (just provide the letter of the option, e.g. A, B, C): "
+        ),
+    },
+    ('entailment', 'zh'): {
+        'query': (
+            "请判断以下两个{lang}句子之间的关系。\n"
+            "句子1：{sentence1}\n"
+            "句子2：{sentence2}\n"
+            "选项：{options}\n"
+            "答案（只需提供选项字母，如A、B、C）："
+        ),
+    },
+    ('text_classification', 'en'): {
+        'query': (
+            "Please classify the following {lang} text.\n"
+            "Text: {text}\n"
+            "Candidate categories: {categories}\n"
+            "Category: "
+        ),
+        'exemplar': (
+            "Please classify the following {lang} text.\n"
+            "Text: {text}\n"
+            "Candidate categories: {categories}\n"
+            "Category: {answer} \n\n"
+        ),
+    },
+    ('text_classification', 'zh'): {
+        'query': (
+            "请判断以下{lang}文本的类别：\n"
+            "文本：{text}\n"
+            "候选类别：{categories}\n"
+            "类别："
+        ),
+    },
+    ('reading_comprehension', 'en'): {
+        'query': (
+            "Based on the following {lang} article, please answer the question in {lang} language.\n"
+            "Article: {context}\n"
+            "Question: {question}\n"
+            "Answer: "
+        ),
+    },
+    ('reading_comprehension', 'zh'): {
+        'query': (
+            "请根据以下{lang}文章用{lang}语回答问题。\n"
+            "文章：{context}\n"
+            "问题：{question}\n"
+            "答案："
+        ),
+    },
+    ('math_reasoning', 'en'): {
+        'query': (
+            "Solve the following {lang} math problem and provide only the final numerical answer.\n"
+            "Problem: {question}\n"
+            "Answer: "
+        ),
+    },
+    ('math_reasoning', 'zh'): {
+        'query': (
+            "解决以下{lang}数学问题，并只提供最终的数字答案。\n"
+            "问题：{question}\n"
+            "答案："
+        ),
+    },
+    ('traditional_culture', 'en'): {
+        'query': (
+            "Please answer the following {lang} question. {hint}\n"
+            "Question: {question}\n"
+            "Answer: "
+        ),
+        'hints': {
+            'bo': "",
+            'mn': "Please answer in traditional Mongolian script.",
+            'ug': ""
+        },
+    },
+    ('traditional_culture', 'zh'): {
+        'query': (
+            "请回答以下{lang}问题。{hint}\n"
+            "问题：{question}\n"
+            "答案："
+        ),
+        'hints': {
+            'bo': "",
+            'mn': "请使用传统蒙古语回答。",
+            'ug': ""
+        },
+    },
+    ('text_generation', 'en'): {
+        'query': (
+            "Please answer the following {lang} question. {hint}\n"
+            "Question: {question}\n"
+            "Answer: "
+        ),
+        'hints': {
+            'bo': "",
+            'mn': "Please answer in traditional Mongolian script.",
+            'ug': ""
+        },
+    },
+    ('text_generation', 'zh'): {
+        'query': (
+            "请回答以下{lang}问题。{hint}\n"
+            "问题：{question}\n"
+            "回答："
+        ),
+        'hints': {
+            'bo': "",
+            'mn': "请使用传统蒙古语。",
+            'ug': ""
+        },
+    },
+}
+
+def fill_exemplar_templates(prompt_templates):
+    """未单独定义示例模板时，以样本模板后接答案作为示例模板"""
+    for templates in prompt_templates.values():
+        for name in [name for name in templates if name.startswith('query')]:
+            templates.setdefault(name.replace('query', 'exemplar', 1), templates[name] + "{answer}\n\n")
+
+fill_exemplar_templates(PROMPT_TEMPLATES)
+
+# special tokens to strip from the output, matched in a single pass
+SPECIAL_TOKEN_PATTERN = re.compile(r'<pad>|</?s>|<unk>|<extra_id_0>')
+
+def bind_template(template, **values):
+    """预先将模板中与样本无关的字段代入固定值，循环内只需填入样本字段"""
+    for name, value in values.items():
+        template = template.replace('{' + name + '}', str(value).replace('{', '{{').replace('}', '}}'))
+    return template
+
+def format_options(options):
+    """将选项列表格式化为 "A. xxx B. yyy " 形式的文本"""
+    return "".join([f"{OPTION_PREFIXES[j]}{option} " for j, option in enumerate(options)])
+
+def build_exemplar_prefix(exemplar_dataset, num_exemplar, template, with_options=False, **values):
+    """
+    将前num_exemplar个示例按模板拼接为提示前缀（问答类任务共用）
+
+    参数:
+        exemplar_dataset: 示例数据集，为None时返回空字符串
+        num_exemplar: 使用的示例数量
+        template: 示例模板，填入示例的question、answer字段
+        with_options: 是否将示例的选项格式化后填入options字段
+        **values: 所有示例共用的模板字段，如语言名称、附加提示
+
+    返回:
+        提示前缀字符串
+    """
+    if exemplar_dataset is None:
+        return ""
+    prefix_parts = []
+    for i in range(min(num_exemplar, len(exemplar_dataset))):
+        example = exemplar_dataset[i]
+        if with_options:
+            values['options'] = format_options(example['option'])
+        prefix_parts.append(template.format(question=example['question'], answer=example['answer'], **values))
+    return "".join(prefix_parts)
+
+def get_clean_field(item, key):
+    """
+    读取数据项中的字段，兼容键带有首尾空格的情况，字符串值去除首尾空格
+
+    返回:
+        字段值；字段不存在时返回None
+    """
+    if key in item:
+        value = item[key]
+    else:
+        # 键可能带有空格，只在直接查找失败时才遍历所有键
+        value = None
+        for raw_key, raw_value in item.items():
+            if raw_key.strip() == key:
+                value = raw_value
+    return value.strip() if isinstance(value, str) else value
+
 # remove special tokens in the output
 def remove_special_tokens(text):
-    text = text.replace('<pad>', '')
-    text = text.replace('<s>', '')
-    text = text.replace('</s>', '')
-    text = text.replace('<unk>', '')
-    text = text.replace('<extra_id_0>', '')
-    text = text.strip()
-    return text
+    return SPECIAL_TOKEN_PATTERN.sub('', text).strip()
 
 def convert_dataset_into_prompt_ethnic_domain_knowledge(input_dataset, exemplar_dataset=None, eval_lang='bo', num_exemplar=3, prompt_lang='zh'):
     """
@@ -147,85 +521,46 @@ def convert_dataset_into_prompt_ethnic_domain_knowledge(input_dataset, exemplar_
         转换后的带有提示的示例列表
     """
     converted_dataset = []
+    
+    # 模板与语言名称表只与提示语言有关，在循环外选定
+    templates = PROMPT_TEMPLATES[('ethnic_domain_knowledge', prompt_lang)]
+    lang_names = LANG_NAMES[prompt_lang]
 
-    prompt_prefix = ""
+    prefix_parts = []
     if exemplar_dataset is not None:
+        eval_lang_name = lang_names[eval_lang]
         for i in range(min(num_exemplar, len(exemplar_dataset))):
             example = exemplar_dataset[i]
             # 处理选项，添加A、B、C、D等编号
-            options_text = ""
-            for j, option in enumerate(example['option']):
-                option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-                options_text += f"{option_label}. {option} "
+            options_text = format_options(example['option'])
             
             # 获取题型
-            question_type = example.get('metadata', {}).get('type', 'Single Choice')
-            
-            if prompt_lang == 'en':
-                if question_type == 'Multiple Choice':
-                    prompt_prefix += f"Please answer the following {abbr_to_lang_en[eval_lang]} ethnic domain knowledge multiple-choice question by selecting the correct options.\n"
-                    prompt_prefix += f"Question: {example['question']}\n"
-                    prompt_prefix += f"Options: {options_text}\n"
-                    prompt_prefix += f"Answer (just provide all correct option letters, e.g. A, BC, ABC, etc.): {example['answer']}\n\n"
-                else:  # 单选题
-                    prompt_prefix += f"Please answer the following {abbr_to_lang_en[eval_lang]} ethnic domain knowledge single-choice question by selecting the correct option.\n"
-                    prompt_prefix += f"Question: {example['question']}\n"
-                    prompt_prefix += f"Options: {options_text}\n"
-                    prompt_prefix += f"Answer (just provide the letter of the option, e.g. A, B, C, etc.): {example['answer']}\n\n"
-            elif prompt_lang == 'zh':
-                if question_type == 'Multiple Choice':
-                    prompt_prefix += f"请回答以下{abbr_to_lang_zh[eval_lang]}民族领域知识多选题，选择所有正确的选项。\n"
-                    prompt_prefix += f"问题：{example['question']}\n"
-                    prompt_prefix += f"选项：{options_text}\n"
-                    prompt_prefix += f"答案（只需提供所有正确选项字母，如A、BC、ABC等，不需要提供额外的解释）：{example['answer']}\n\n"
-                else:  # 单选题
-                    prompt_prefix += f"请回答以下{abbr_to_lang_zh[eval_lang]}民族领域知识单选题，选择正确的选项。\n"
-                    prompt_prefix += f"问题：{example['question']}\n"
-                    prompt_prefix += f"选项：{options_text}\n"
-                    prompt_prefix += f"答案（只需提供选项字母，如A、B、C等，不需要提供额外的解释）：{example['answer']}\n\n"
-
-    for i in range(len(input_dataset)):
-        item = input_dataset[i]
+            question_type = (example.get('metadata') or EMPTY_METADATA).get('type', 'Single Choice')
+            template = templates['exemplar_multiple'] if question_type == 'Multiple Choice' else templates['exemplar']
+            prefix_parts.append(template.format(lang=eval_lang_name, question=example['question'],
+                                                options=options_text, answer=example['answer']))
+    prompt_prefix = "".join(prefix_parts)
+    
+    # 样本语言通常与评估语言相同，预先代入语言名称，只有不同时才重新代入
+    eval_name = lang_names.get(eval_lang, eval_lang)
+    eval_queries = {name: bind_template(templates[name], lang=eval_name) for name in ('query', 'query_multiple')}
+
+    for item in input_dataset:
         qid = item['id']
 
         # 根据metadata中的language字段获取语言
-        if 'metadata' in item and 'language' in item['metadata']:
-            lang = item['metadata']['language']
-        else:
-            lang = eval_lang
+        meta = item.get('metadata') or EMPTY_METADATA
+        lang = meta.get('language', eval_lang)
             
         # 获取题型
-        question_type = item.get('metadata', {}).get('type', '单选题')
+        question_type = meta.get('type', '单选题')
             
         # 处理选项，添加A、B、C、D等编号
-        options_text = ""
-        for j, option in enumerate(item['option']):
-            option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-            options_text += f"{option_label}. {option} "
+        options_text = format_options(item['option'])
             
-        prompt = prompt_prefix
-        if prompt_lang == 'en':
-            if question_type == 'Multiple Choice':
-                prompt += f"Please answer the following {abbr_to_lang_en.get(lang, lang)} ethnic domain knowledge multiple-choice question by selecting the correct options.\n"
-                prompt += f"Question: {item['question']}\n"
-                prompt += f"Options: {options_text}\n"
-                prompt += f"Answer (provide all correct option letters, e.g. A, BC, ABC, etc.): "
-            else:  # 单选题
-                prompt += f"Please answer the following {abbr_to_lang_en.get(lang, lang)} ethnic domain knowledge single-choice question by selecting the correct option.\n"
-                prompt += f"Question: {item['question']}\n"
-                prompt += f"Options: {options_text}\n"
-                prompt += f"Answer (just provide the letter of the option, e.g. A, B, C, etc.): "
-        elif prompt_lang == 'zh':
-            if question_type == 'Multiple Choice':
-                prompt += f"请回答以下{abbr_to_lang_zh.get(lang, lang)}民族领域知识多选题，选择所有正确的选项。\n"
-                prompt += f"问题：{item['question']}\n"
-                prompt += f"选项：{options_text}\n"
-                prompt += f"答案（只需提供所有正确选项字母，如A、BC、ABC等，不需要提供额外的解释）："
-            else:  # 单选题
-                prompt += f"请回答以下{abbr_to_lang_zh.get(lang, lang)}民族领域知识单选题，选择正确的选项。\n"
-                prompt += f"问题：{item['question']}\n"
-                prompt += f"选项：{options_text}\n"
-                prompt += f"答案（只需提供选项字母，如A、B、C等，不需要提供额外的解释）："
+        name = 'query_multiple' if question_type == 'Multiple Choice' else 'query'
+        query = eval_queries[name] if lang == eval_lang else bind_template(templates[name], lang=lang_names.get(lang, lang))
+        prompt = prompt_prefix + query.format(question=item['question'], options=options_text)
         
         converted_dataset.append({
             "id": qid,
@@ -254,44 +589,25 @@ def convert_dataset_into_prompt_translation(input_dataset, exemplar_dataset=None
 
     converted_dataset = []
     
-    # 添加不同语言的翻译提示
-    language_prompts_zh = {
-        'bo': "",
-        'mn': "请使用传统蒙古文(竖写蒙古文)进行翻译。",
-        'ug': ""
-    }
-    
-    language_prompts_en = {
-        'bo': "",
-        'mn': "Please translate into traditional Mongolian script (vertical Mongolian script).",
-        'ug': ""
-    }
-
-    prompt_prefix = ""
+    # 源/目标语言在整个数据集中固定，语言名称与目标语言的附加提示在循环外确定
+    templates = PROMPT_TEMPLATES[('translation', prompt_lang)]
+    lang_names = LANG_NAMES[prompt_lang]
+    src_name = lang_names[src_lang]
+    tgt_name = lang_names[tgt_lang]
+    hint = templates['hints'].get(tgt_lang, '')
+
+    prefix_parts = []
     if exemplar_dataset is not None:
         for i in range(min(num_exemplar, len(exemplar_dataset))):
-            if prompt_lang == 'en':
-                prompt_prefix += f"Please translate the following {abbr_to_lang_en[src_lang]} text into {abbr_to_lang_en[tgt_lang]}. {language_prompts_en.get(tgt_lang, '')}\n"
-                prompt_prefix += f"{abbr_to_lang_en[src_lang]}: {exemplar_dataset[i][src_lang]}\n"
-                prompt_prefix += f"{abbr_to_lang_en[tgt_lang]}: {exemplar_dataset[i][tgt_lang]}\n\n"
-            elif prompt_lang == 'zh':
-                prompt_prefix += f"请将下面的{abbr_to_lang_zh[src_lang]}文本翻译成{abbr_to_lang_zh[tgt_lang]}。{language_prompts_zh.get(tgt_lang, '')}\n"
-                prompt_prefix += f"{abbr_to_lang_zh[src_lang]}：{exemplar_dataset[i][src_lang]}\n"
-                prompt_prefix += f"{abbr_to_lang_zh[tgt_lang]}：{exemplar_dataset[i][tgt_lang]}\n\n"
-
-    for i in range(len(input_dataset)):
-        item = input_dataset[i]
+            prefix_parts.append(templates['exemplar'].format(src=src_name, tgt=tgt_name, hint=hint,
+                                                             text=exemplar_dataset[i][src_lang], answer=exemplar_dataset[i][tgt_lang]))
+    prompt_prefix = "".join(prefix_parts)
+    query = bind_template(templates['query'], src=src_name, tgt=tgt_name, hint=hint)
+
+    for item in input_dataset:
         qid = item['id']
 
-        prompt = prompt_prefix
-        if prompt_lang == 'en':
-            prompt += f"Please translate the following {abbr_to_lang_en[src_lang]} text into {abbr_to_lang_en[tgt_lang]}. {language_prompts_en.get(tgt_lang, '')}\n"
-            prompt += f"{abbr_to_lang_en[src_lang]}: {item[src_lang]}\n"
-            prompt += f"{abbr_to_lang_en[tgt_lang]}: "
-        elif prompt_lang == 'zh':
-            prompt += f"请将下面的{abbr_to_lang_zh[src_lang]}文本翻译成{abbr_to_lang_zh[tgt_lang]}。{language_prompts_zh.get(tgt_lang, '')}\n"
-            prompt += f"{abbr_to_lang_zh[src_lang]}：{item[src_lang]}\n"
-            prompt += f"{abbr_to_lang_zh[tgt_lang]}："
+        prompt = prompt_prefix + query.format(text=item[src_lang])
 
         converted_dataset.append({
             "id": qid,
@@ -317,15 +633,15 @@ def convert_dataset_into_prompt_coref_resolution(input_dataset, exemplar_dataset
     """
     converted_dataset = []
     
-    prompt_prefix = ""
+    templates = PROMPT_TEMPLATES[('coref_resolution', prompt_lang)]
+    lang_names = LANG_NAMES[prompt_lang]
+    
+    prefix_parts = []
     if exemplar_dataset is not None:
         for i in range(min(num_exemplar, len(exemplar_dataset))):
             example = exemplar_dataset[i]
             # 处理选项，添加A、B等编号
-            options_text = ""
-            for j, option in enumerate(example['option']):
-                option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-                options_text += f"{option_label}. {option} "
+            options_text = format_options(example['option'])
             
             # 从answer字段获取示例答案（如果存在）
             example_answer = example.get('answer', None)
@@ -334,56 +650,32 @@ def convert_dataset_into_prompt_coref_resolution(input_dataset, exemplar_dataset
                 if isinstance(example['label'], bool):
                     label_str = str(example['label']).lower()
                     correct_index = example['option'].index(label_str)
-                    example_answer = chr(65 + correct_index)
+                    example_answer = OPTION_LETTERS[correct_index]
                 else:
                     example_answer = example['label']
             
-            if prompt_lang == 'en':
-                prompt_prefix += f"Please determine if the two spans in the following {abbr_to_lang_en[eval_lang]} text refer to the same entity.\n"
-                prompt_prefix += f"Text: {example['text']}\n"
-                prompt_prefix += f"Span 1: {example['span1_text']}\n"
-                prompt_prefix += f"Span 2: {example['span2_text']}\n"
-                prompt_prefix += f"Options: {options_text}\n"
-                prompt_prefix += f"Answer (just provide the letter of the option, e.g. A, B): {example_answer}\n\n"
-            elif prompt_lang == 'zh':
-                prompt_prefix += f"请判断以下{abbr_to_lang_zh[eval_lang]}文本中的两个片段是否指代同一个实体。\n"
-                prompt_prefix += f"文本：{example['text']}\n"
-                prompt_prefix += f"片段1：{example['span1_text']}\n"
-                prompt_prefix += f"片段2：{example['span2_text']}\n"
-                prompt_prefix += f"选项：{options_text}\n"
-                prompt_prefix += f"答案（只需提供选项字母，如A、B）：{example_answer}\n\n"
-
-    for i in range(len(input_dataset)):
-        item = input_dataset[i]
+            prefix_parts.append(templates['exemplar'].format(lang=lang_names[eval_lang], text=example['text'],
+                                                             span1=example['span1_text'], span2=example['span2_text'],
+                                                             options=options_text, answer=example_answer))
+    prompt_prefix = "".join(prefix_parts)
+    
+    # 样本语言通常与评估语言相同，预先代入语言名称，只有不同时才重新代入
+    eval_query = bind_template(templates['query'], lang=lang_names.get(eval_lang, eval_lang))
+
+    for item in input_dataset:
         qid = item['id']
 
         # 根据metadata中的language字段获取语言
-        if 'metadata' in item and 'language' in item['metadata']:
-            lang = item['metadata']['language']
-        else:
-            lang = eval_lang
+        meta = item.get('metadata') or EMPTY_METADATA
+        lang = meta.get('language', eval_lang)
             
         # 处理选项，添加A、B等编号
-        options_text = ""
-        for j, option in enumerate(item['option']):
-            option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-            options_text += f"{option_label}. {option} "
+        options_text = format_options(item['option'])
             
-        prompt = prompt_prefix
-        if prompt_lang == 'en':
-            prompt += f"Please determine if the two spans in the following {abbr_to_lang_en.get(lang, lang)} text refer to the same entity.\n"
-            prompt += f"Text: {item['text']}\n"
-            prompt += f"Span 1: {item['span1_text']}\n"
-            prompt += f"Span 2: {item['span2_text']}\n"
-            prompt += f"Options: {options_text}\n"
-            prompt += f"Answer (just provide the letter of the option, e.g. A, B): "
-        elif prompt_lang == 'zh':
-            prompt += f"请判断以下{abbr_to_lang_zh.get(lang, lang)}文本中的两个片段是否指代同一个实体。\n"
-            prompt += f"文本：{item['text']}\n"
-            prompt += f"片段1：{item['span1_text']}\n"
-            prompt += f"片段2：{item['span2_text']}\n"
-            prompt += f"选项：{options_text}\n"
-            prompt += f"答案（只需提供选项字母，如A、B）："
+        query = eval_query if lang == eval_lang else bind_template(templates['query'], lang=lang_names.get(lang, lang))
+        prompt = prompt_prefix + query.format(text=item['text'],
+                                              span1=item['span1_text'], span2=item['span2_text'],
+                                              options=options_text)
         
         # 首先尝试从answer字段获取gold
         if 'answer' in item:
@@ -396,7 +688,7 @@ def convert_dataset_into_prompt_coref_resolution(input_dataset, exemplar_dataset
                 # 获取该字符串在选项中的索引
                 correct_index = item['option'].index(label_str)
                 # 转换为对应的字母
-                gold = chr(65 + correct_index)
+                gold = OPTION_LETTERS[correct_index]
             else:
                 # 如果标签已经是字母形式，直接使用
                 gold = item['label']
@@ -437,91 +729,58 @@ def convert_dataset_into_prompt_entailment(input_dataset, exemplar_dataset=None,
         'entailment': 'entailment',
         'neutral': 'neutral'
     }
+    label_map = label_map_zh if prompt_lang == 'zh' else label_map_en
+    templates = PROMPT_TEMPLATES[('entailment', prompt_lang)]
+    lang_names = LANG_NAMES[prompt_lang]
 
-    # 清理数据中键的空格
-    def clean_item_keys(item):
-        cleaned_item = {}
-        for key, value in item.items():
-            cleaned_key = key.strip()
-            if isinstance(value, str):
-                cleaned_item[cleaned_key] = value.strip()
-            else:
-                cleaned_item[cleaned_key] = value
-        return cleaned_item
-    
-    cleaned_input_dataset = [clean_item_keys(item) for item in input_dataset]
-    cleaned_exemplar_dataset = [clean_item_keys(item) for item in exemplar_dataset] if exemplar_dataset is not None else None
-    
-    prompt_prefix = ""
-    if cleaned_exemplar_dataset is not None:
-        for i in range(min(num_exemplar, len(cleaned_exemplar_dataset))):
-            example = cleaned_exemplar_dataset[i]
+    # 数据中的键和字符串值可能带有空格，只在读取用到的字段时清理
+    prefix_parts = []
+    if exemplar_dataset is not None:
+        for i in range(min(num_exemplar, len(exemplar_dataset))):
+            example = exemplar_dataset[i]
+            example_options = get_clean_field(example, 'option')
             
             # 处理选项，添加A、B、C等编号
-            options_text = ""
-            for j, option in enumerate(example['option']):
-                option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-                option_text = label_map_zh[option] if prompt_lang == 'zh' else label_map_en[option]
-                options_text += f"{option_label}. {option_text} "
+            options_text = format_options([label_map[option] for option in example_options])
             
             # 获取示例答案（优先使用answer字段）
-            example_answer = example.get('answer', None)
+            example_answer = get_clean_field(example, 'answer')
             if example_answer is None:
                 # 如果answer字段不存在，则从label生成答案
-                correct_index = example['option'].index(example['label'])
-                example_answer = chr(65 + correct_index)
+                correct_index = example_options.index(get_clean_field(example, 'label'))
+                example_answer = OPTION_LETTERS[correct_index]
             
-            if prompt_lang == 'en':
-                prompt_prefix += f"Please determine the relationship between the following two {abbr_to_lang_en[eval_lang]} sentences.\n"
-                prompt_prefix += f"Sentence 1: {example['sentence1']}\n"
-                prompt_prefix += f"Sentence 2: {example['sentence2']}\n"
-                prompt_prefix += f"Options: {options_text}\n"
-                prompt_prefix += f"Answer (just provide the letter of the option, e.g. A, B, C): {example_answer}\n\n"
-            elif prompt_lang == 'zh':
-                prompt_prefix += f"请判断以下两个{abbr_to_lang_zh[eval_lang]}句子之间的关系。\n"
-                prompt_prefix += f"句子1：{example['sentence1']}\n"
-                prompt_prefix += f"句子2：{example['sentence2']}\n"
-                prompt_prefix += f"选项：{options_text}\n"
-                prompt_prefix += f"答案（只需提供选项字母，如A、B、C）：{example_answer}\n\n"
-
-    for i in range(len(cleaned_input_dataset)):
-        item = cleaned_input_dataset[i]
-        qid = item['id']
+            prefix_parts.append(templates['exemplar'].format(lang=lang_names[eval_lang],
+                                                             sentence1=get_clean_field(example, 'sentence1'),
+                                                             sentence2=get_clean_field(example, 'sentence2'),
+                                                             options=options_text, answer=example_answer))
+    prompt_prefix = "".join(prefix_parts)
+    
+    # 样本语言通常与评估语言相同，预先代入语言名称，只有不同时才重新代入
+    eval_query = bind_template(templates['query'], lang=lang_names.get(eval_lang, eval_lang))
+
+    for item in input_dataset:
+        qid = get_clean_field(item, 'id')
+        item_options = get_clean_field(item, 'option')
 
         # 根据metadata中的language字段获取语言
-        if 'metadata' in item and 'language' in item['metadata']:
-            lang = item['metadata']['language']
-        else:
-            lang = eval_lang
+        meta = get_clean_field(item, 'metadata') or EMPTY_METADATA
+        lang = meta.get('language', eval_lang)
             
         # 处理选项，添加A、B、C等编号
-        options_text = ""
-        for j, option in enumerate(item['option']):
-            option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-            option_text = label_map_zh[option] if prompt_lang == 'zh' else label_map_en[option]
-            options_text += f"{option_label}. {option_text} "
+        options_text = format_options([label_map[option] for option in item_options])
             
-        prompt = prompt_prefix
-        if prompt_lang == 'en':
-            prompt += f"Please determine the relationship between the following two {abbr_to_lang_en.get(lang, lang)} sentences.\n"
-            prompt += f"Sentence 1: {item['sentence1']}\n"
-            prompt += f"Sentence 2: {item['sentence2']}\n"
-            prompt += f"Options: {options_text}\n"
-            prompt += f"Answer (just provide the letter of the option, e.g. A, B, C): "
-        elif prompt_lang == 'zh':
-            prompt += f"请判断以下两个{abbr_to_lang_zh.get(lang, lang)}句子之间的关系。\n"
-            prompt += f"句子1：{item['sentence1']}\n"
-            prompt += f"句子2：{item['sentence2']}\n"
-            prompt += f"选项：{options_text}\n"
-            prompt += f"答案（只需提供选项字母，如A、B、C）："
+        query = eval_query if lang == eval_lang else bind_template(templates['query'], lang=lang_names.get(lang, lang))
+        prompt = prompt_prefix + query.format(sentence1=get_clean_field(item, 'sentence1'),
+                                              sentence2=get_clean_field(item, 'sentence2'),
+                                              options=options_text)
         
         # 获取gold答案（优先使用answer字段）
-        if 'answer' in item:
-            gold = item['answer']
-        else:
+        gold = get_clean_field(item, 'answer')
+        if gold is None:
             # 如果没有answer字段，则从label生成答案
-            correct_index = item['option'].index(item['label'])
-            gold = chr(65 + correct_index)
+            correct_index = item_options.index(get_clean_field(item, 'label'))
+            gold = OPTION_LETTERS[correct_index]
             
         converted_dataset.append({
             "id": qid,
@@ -558,42 +817,35 @@ def convert_dataset_into_prompt_text_classification(input_dataset, exemplar_data
     elif prompt_lang == 'zh':
         concated_categories = '、'.join(categories_zh)
     
-    prompt_prefix = ""
+    templates = PROMPT_TEMPLATES[('text_classification', prompt_lang)]
+    lang_names = LANG_NAMES[prompt_lang]
+    
+    prefix_parts = []
     if exemplar_dataset is not None:
         for i in range(min(num_exemplar, len(exemplar_dataset))):
             example = exemplar_dataset[i]
+            # 示例标签为中文类别，英文提示下换成对应的英文类别
             if prompt_lang == 'en':
-                prompt_prefix += f"Please classify the following {abbr_to_lang_en[eval_lang]} text.\n"
-                prompt_prefix += f"Text: {example['text'][:max_passage_len]}\n"
-                prompt_prefix += f"Candidate categories: {concated_categories}\n"
-                prompt_prefix += f"Category: {categories_en[categories_zh.index(example['label'])]} \n\n"
-            elif prompt_lang == 'zh':
-                prompt_prefix += f"请判断以下{abbr_to_lang_zh[eval_lang]}文本的类别：\n"
-                prompt_prefix += f"文本：{example['text'][:max_passage_len]}\n"
-                prompt_prefix += f"候选类别：{concated_categories}\n"
-                prompt_prefix += f"类别：{example['label']}\n\n"
-
-    for i in range(len(input_dataset)):
-        item = input_dataset[i]
+                example_label = categories_en[categories_zh.index(example['label'])]
+            else:
+                example_label = example['label']
+            prefix_parts.append(templates['exemplar'].format(lang=lang_names[eval_lang], text=example['text'][:max_passage_len],
+                                                             categories=concated_categories, answer=example_label))
+    prompt_prefix = "".join(prefix_parts)
+    
+    # 候选类别固定；样本语言通常与评估语言相同，预先代入语言名称，只有不同时才重新代入
+    query_template = bind_template(templates['query'], categories=concated_categories)
+    eval_query = bind_template(query_template, lang=lang_names.get(eval_lang, eval_lang))
+
+    for item in input_dataset:
         qid = item['id']
 
         # 根据metadata中的language字段获取语言
-        if 'metadata' in item and 'language' in item['metadata']:
-            lang = item['metadata']['language']
-        else:
-            lang = eval_lang
+        meta = item.get('metadata') or EMPTY_METADATA
+        lang = meta.get('language', eval_lang)
             
-        prompt = prompt_prefix
-        if prompt_lang == 'en':
-            prompt += f"Please classify the following {abbr_to_lang_en.get(lang, lang)} text.\n"
-            prompt += f"Text: {item['text'][:max_passage_len]}\n"
-            prompt += f"Candidate categories: {concated_categories}\n"
-            prompt += f"Category: "
-        elif prompt_lang == 'zh':
-            prompt += f"请判断以下{abbr_to_lang_zh.get(lang, lang)}文本的类别：\n"
-            prompt += f"文本：{item['text'][:max_passage_len]}\n"
-            prompt += f"候选类别：{concated_categories}\n"
-            prompt += f"类别："
+        query = eval_query if lang == eval_lang else bind_template(query_template, lang=lang_names.get(lang, lang))
+        prompt = prompt_prefix + query.format(text=item['text'][:max_passage_len])
         
         # 设置gold答案
         if prompt_lang == 'en' and item['label'] in categories_zh:
@@ -626,42 +878,29 @@ def convert_dataset_into_prompt_reading_comprehension(input_dataset, exemplar_da
     """
     converted_dataset = []
     
-    prompt_prefix = ""
+    templates = PROMPT_TEMPLATES[('reading_comprehension', prompt_lang)]
+    lang_names = LANG_NAMES[prompt_lang]
+    
+    prefix_parts = []
     if exemplar_dataset is not None:
         for i in range(min(num_exemplar, len(exemplar_dataset))):
             example = exemplar_dataset[i]
-            if prompt_lang == 'en':
-                prompt_prefix += f"Based on the following {abbr_to_lang_en[eval_lang]} article, please answer the question in {abbr_to_lang_en[eval_lang]} language.\n"
-                prompt_prefix += f"Article: {example['context_text']}\n"
-                prompt_prefix += f"Question: {example['query_text']}\n"
-                prompt_prefix += f"Answer: {example['answer']}\n\n"
-            elif prompt_lang == 'zh':
-                prompt_prefix += f"请根据以下{abbr_to_lang_zh[eval_lang]}文章用{abbr_to_lang_zh[eval_lang]}语回答问题。\n"
-                prompt_prefix += f"文章：{example['context_text']}\n"
-                prompt_prefix += f"问题：{example['query_text']}\n"
-                prompt_prefix += f"答案：{example['answer']}\n\n"
-
-    for i in range(len(input_dataset)):
-        item = input_dataset[i]
+            prefix_parts.append(templates['exemplar'].format(lang=lang_names[eval_lang], context=example['context_text'],
+                                                             question=example['query_text'], answer=example['answer']))
+    prompt_prefix = "".join(prefix_parts)
+    
+    # 样本语言通常与评估语言相同，预先代入语言名称，只有不同时才重新代入
+    eval_query = bind_template(templates['query'], lang=lang_names.get(eval_lang, eval_lang))
+
+    for item in input_dataset:
         qid = item['query_id'] if 'query_id' in item else item['id']
 
         # 根据metadata中的language字段获取语言
-        if 'metadata' in item and 'language' in item['metadata']:
-            lang = item['metadata']['language']
-        else:
-            lang = eval_lang
+        meta = item.get('metadata') or EMPTY_METADATA
+        lang = meta.get('language', eval_lang)
             
-        prompt = prompt_prefix
-        if prompt_lang == 'en':
-            prompt += f"Based on the following {abbr_to_lang_en.get(lang, lang)} article, please answer the question in {abbr_to_lang_en.get(lang, lang)} language.\n"
-            prompt += f"Article: {item['context_text']}\n"
-            prompt += f"Question: {item['query_text']}\n"
-            prompt += f"Answer: "
-        elif prompt_lang == 'zh':
-            prompt += f"请根据以下{abbr_to_lang_zh.get(lang, lang)}文章用{abbr_to_lang_zh.get(lang, lang)}语回答问题。\n"
-            prompt += f"文章：{item['context_text']}\n"
-            prompt += f"问题：{item['query_text']}\n"
-            prompt += f"答案："
+        query = eval_query if lang == eval_lang else bind_template(templates['query'], lang=lang_names.get(lang, lang))
+        prompt = prompt_prefix + query.format(context=item['context_text'], question=item['query_text'])
         
         converted_dataset.append({
             "id": qid,
@@ -686,55 +925,28 @@ def convert_dataset_into_prompt_safety(input_dataset, exemplar_dataset=None, eva
         转换后的带有提示的示例列表
     """
     converted_dataset = []
+    
+    templates = PROMPT_TEMPLATES[('safety', prompt_lang)]
+    lang_names = LANG_NAMES[prompt_lang]
 
-    prompt_prefix = ""
-    if exemplar_dataset is not None:
-        for i in range(min(num_exemplar, len(exemplar_dataset))):
-            example = exemplar_dataset[i]
-            # 处理选项，添加A、B、C、D等编号
-            options_text = ""
-            for j, option in enumerate(example['option']):
-                option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-                options_text += f"{option_label}. {option} "
-            
-            if prompt_lang == 'en':
-                prompt_prefix += f"Please answer the following {abbr_to_lang_en[eval_lang]} question by selecting the correct option.\n"
-                prompt_prefix += f"Question: {example['question']}\n"
-                prompt_prefix += f"Options: {options_text}\n"
-                prompt_prefix += f"Answer (just provide the letter of the option, e.g. A, B, C, etc.): {example['answer']}\n\n"
-            elif prompt_lang == 'zh':
-                prompt_prefix += f"请回答以下{abbr_to_lang_zh[eval_lang]}问题，选择正确的选项。\n"
-                prompt_prefix += f"问题：{example['question']}\n"
-                prompt_prefix += f"选项：{options_text}\n"
-                prompt_prefix += f"答案（只需提供选项字母，如A、B、C等）：{example['answer']}\n\n"
-
-    for i in range(len(input_dataset)):
-        item = input_dataset[i]
+    prompt_prefix = build_exemplar_prefix(exemplar_dataset, num_exemplar, templates['exemplar'], with_options=True,
+                                          lang=lang_names.get(eval_lang, eval_lang))
+    
+    # 样本语言通常与评估语言相同，预先代入语言名称，只有不同时才重新代入
+    eval_query = bind_template(templates['query'], lang=lang_names.get(eval_lang, eval_lang))
+
+    for item in input_dataset:
         qid = item['id']
 
         # 根据metadata中的language字段获取语言
-        if 'metadata' in item and 'language' in item['metadata']:
-            lang = item['metadata']['language']
-        else:
-            lang = eval_lang
+        meta = item.get('metadata') or EMPTY_METADATA
+        lang = meta.get('language', eval_lang)
             
         # 处理选项，添加A、B、C、D等编号
-        options_text = ""
-        for j, option in enumerate(item['option']):
-            option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-            options_text += f"{option_label}. {option} "
+        options_text = format_options(item['option'])
             
-        prompt = prompt_prefix
-        if prompt_lang == 'en':
-            prompt += f"Please answer the following {abbr_to_lang_en.get(lang, lang)} question by selecting the correct option.\n"
-            prompt += f"Question: {item['question']}\n"
-            prompt += f"Options: {options_text}\n"
-            prompt += f"Answer (just provide the letter of the option, e.g. A, B, C, etc.): "
-        elif prompt_lang == 'zh':
-            prompt += f"请回答以下{abbr_to_lang_zh.get(lang, lang)}问题，选择正确的选项。\n"
-            prompt += f"问题：{item['question']}\n"
-            prompt += f"选项：{options_text}\n"
-            prompt += f"答案（只需提供选项字母，如A、B、C等）："
+        query = eval_query if lang == eval_lang else bind_template(templates['query'], lang=lang_names.get(lang, lang))
+        prompt = prompt_prefix + query.format(question=item['question'], options=options_text)
         
         converted_dataset.append({
             "id": qid,
@@ -759,66 +971,40 @@ def convert_dataset_into_prompt_professional_skills(input_dataset, exemplar_data
         转换后的带有提示的示例列表
     """
     converted_dataset = []
+    
+    templates = PROMPT_TEMPLATES[('professional_skills', prompt_lang)]
+    lang_names = LANG_NAMES[prompt_lang]
 
-    prompt_prefix = ""
-    if exemplar_dataset is not None:
-        for i in range(min(num_exemplar, len(exemplar_dataset))):
-            example = exemplar_dataset[i]
-            # 处理选项，添加A、B、C、D等编号
-            options_text = ""
-            for j, option in enumerate(example['option']):
-                option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-                options_text += f"{option_label}. {option} "
-            
-            if prompt_lang == 'en':
-                prompt_prefix += f"Please answer the following {abbr_to_lang_en[eval_lang]} professional knowledge question by selecting the correct option.\n"
-                prompt_prefix += f"Question: {example['question']}\n"
-                prompt_prefix += f"Options: {options_text}\n"
-                prompt_prefix += f"Answer (just provide the letter of the option, e.g. A, B, C, etc.): {example['answer']}\n\n"
-            elif prompt_lang == 'zh':
-                prompt_prefix += f"请回答以下{abbr_to_lang_zh[eval_lang]}专业知识问题，选择正确的选项。\n"
-                prompt_prefix += f"问题：{example['question']}\n"
-                prompt_prefix += f"选项：{options_text}\n"
-                prompt_prefix += f"答案（只需提供选项字母，如A、B、C等）：{example['answer']}\n\n"
-
-    for i in range(len(input_dataset)):
-        item = input_dataset[i]
+    prompt_prefix = build_exemplar_prefix(exemplar_dataset, num_exemplar, templates['exemplar'], with_options=True,
+                                          lang=lang_names.get(eval_lang, eval_lang), domain_info="")
+    
+    # 样本语言通常与评估语言相同，预先代入语言名称，只有不同时才重新代入
+    eval_query = bind_template(templates['query'], lang=lang_names.get(eval_lang, eval_lang))
+
+    for item in input_dataset:
         qid = item['id']
 
         # 根据metadata中的language字段获取语言
-        if 'metadata' in item and 'language' in item['metadata']:
-            lang = item['metadata']['language']
-        else:
-            lang = eval_lang
+        meta = item.get('metadata') or EMPTY_METADATA
+        lang = meta.get('language', eval_lang)
             
         # 处理选项，添加A、B、C、D等编号
-        options_text = ""
-        for j, option in enumerate(item['option']):
-            option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-            options_text += f"{option_label}. {option} "
+        options_text = format_options(item['option'])
             
         # 获取专业领域信息（如果存在）
         domain_info = ""
-        if 'task' in item and 'domain' in item['task']:
-            domain = item['task']['domain']
-            sub_domain = item['task'].get('sub_domain', '')
+        task_info = item.get('task') or {}
+        if 'domain' in task_info:
+            domain = task_info['domain']
+            sub_domain = task_info.get('sub_domain', '')
             
-            if prompt_lang == 'en':
-                domain_info = f" (Domain: {domain}, Sub-domain: {sub_domain})" if sub_domain else f" (Domain: {domain})"
-            elif prompt_lang == 'zh':
-                domain_info = f"（领域：{domain}，子领域：{sub_domain}）" if sub_domain else f"（领域：{domain}）"
+            if sub_domain:
+                domain_info = templates['domain_sub'].format(domain=domain, sub_domain=sub_domain)
+            else:
+                domain_info = templates['domain'].format(domain=domain)
             
-        prompt = prompt_prefix
-        if prompt_lang == 'en':
-            prompt += f"Please answer the following {abbr_to_lang_en.get(lang, lang)} professional knowledge question{domain_info} by selecting the correct option.\n"
-            prompt += f"Question: {item['question']}\n"
-            prompt += f"Options: {options_text}\n"
-            prompt += f"Answer (just provide the letter of the option, e.g. A, B, C, etc.): "
-        elif prompt_lang == 'zh':
-            prompt += f"请回答以下{abbr_to_lang_zh.get(lang, lang)}专业知识问题{domain_info}，选择正确的选项。\n"
-            prompt += f"问题：{item['question']}\n"
-            prompt += f"选项：{options_text}\n"
-            prompt += f"答案（只需提供选项字母，如A、B、C等）："
+        query = eval_query if lang == eval_lang else bind_template(templates['query'], lang=lang_names.get(lang, lang))
+        prompt = prompt_prefix + query.format(question=item['question'], options=options_text, domain_info=domain_info)
         
         converted_dataset.append({
             "id": qid,
@@ -843,55 +1029,28 @@ def convert_dataset_into_prompt_ethnic_vocabulary(input_dataset, exemplar_datase
         转换后的带有提示的示例列表
     """
     converted_dataset = []
+    
+    templates = PROMPT_TEMPLATES[('ethnic_vocabulary', prompt_lang)]
+    lang_names = LANG_NAMES[prompt_lang]
 
-    prompt_prefix = ""
-    if exemplar_dataset is not None:
-        for i in range(min(num_exemplar, len(exemplar_dataset))):
-            example = exemplar_dataset[i]
-            # 处理选项，添加A、B、C、D等编号
-            options_text = ""
-            for j, option in enumerate(example['option']):
-                option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-                options_text += f"{option_label}. {option} "
-            
-            if prompt_lang == 'en':
-                prompt_prefix += f"Please select the Chinese term that corresponds to the {abbr_to_lang_en[eval_lang]} ethnic vocabulary term in the question.\n"
-                prompt_prefix += f"Question: {example['question']}\n"
-                prompt_prefix += f"Options: {options_text}\n"
-                prompt_prefix += f"Answer (just provide the letter of the option, e.g. A, B, C, etc.): {example['answer']}\n\n"
-            elif prompt_lang == 'zh':
-                prompt_prefix += f"请选择与问题中的词汇术语对应的{abbr_to_lang_zh[eval_lang]}术语。\n"
-                prompt_prefix += f"问题：{example['question']}\n"
-                prompt_prefix += f"选项：{options_text}\n"
-                prompt_prefix += f"答案（只需提供选项字母，如A、B、C等）：{example['answer']}\n\n"
-
-    for i in range(len(input_dataset)):
-        item = input_dataset[i]
+    prompt_prefix = build_exemplar_prefix(exemplar_dataset, num_exemplar, templates['exemplar'], with_options=True,
+                                          lang=lang_names.get(eval_lang, eval_lang))
+    
+    # 样本语言通常与评估语言相同，预先代入语言名称，只有不同时才重新代入
+    eval_query = bind_template(templates['query'], lang=lang_names.get(eval_lang, eval_lang))
+
+    for item in input_dataset:
         qid = item['id']
 
         # 根据metadata中的language字段获取语言
-        if 'metadata' in item and 'language' in item['metadata']:
-            lang = item['metadata']['language']
-        else:
-            lang = eval_lang
+        meta = item.get('metadata') or EMPTY_METADATA
+        lang = meta.get('language', eval_lang)
             
         # 处理选项，添加A、B、C、D等编号
-        options_text = ""
-        for j, option in enumerate(item['option']):
-            option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-            options_text += f"{option_label}. {option} "
+        options_text = format_options(item['option'])
             
-        prompt = prompt_prefix
-        if prompt_lang == 'en':
-            prompt += f"Please select the Chinese term that corresponds to the {abbr_to_lang_en.get(lang, lang)} ethnic vocabulary term in the question.\n"
-            prompt += f"Question: {item['question']}\n"
-            prompt += f"Options: {options_text}\n"
-            prompt += f"Answer (just provide the letter of the option, e.g. A, B, C, etc.): "
-        elif prompt_lang == 'zh':
-            prompt += f"请选择与问题中的词汇术语对应的{abbr_to_lang_zh.get(lang, lang)}术语。\n"
-            prompt += f"问题：{item['question']}\n"
-            prompt += f"选项：{options_text}\n"
-            prompt += f"答案（只需提供选项字母，如A、B、C等）："
+        query = eval_query if lang == eval_lang else bind_template(templates['query'], lang=lang_names.get(lang, lang))
+        prompt = prompt_prefix + query.format(question=item['question'], options=options_text)
         
         converted_dataset.append({
             "id": qid,
@@ -917,38 +1076,24 @@ def convert_dataset_into_prompt_math_reasoning(input_dataset, exemplar_dataset=N
     """
     converted_dataset = []
 
-    prompt_prefix = ""
-    if exemplar_dataset is not None:
-        for i in range(min(num_exemplar, len(exemplar_dataset))):
-            example = exemplar_dataset[i]
-            if prompt_lang == 'en':
-                prompt_prefix += f"Solve the following {abbr_to_lang_en[eval_lang]} math problem and provide only the final numerical answer.\n"
-                prompt_prefix += f"Problem: {example['question']}\n"
-                prompt_prefix += f"Answer: {example['answer']}\n\n"
-            elif prompt_lang == 'zh':
-                prompt_prefix += f"解决以下{abbr_to_lang_zh[eval_lang]}数学问题，并只提供最终的数字答案。\n"
-                prompt_prefix += f"问题：{example['question']}\n"
-                prompt_prefix += f"答案：{example['answer']}\n\n"
-
-    for i in range(len(input_dataset)):
-        item = input_dataset[i]
+    templates = PROMPT_TEMPLATES[('math_reasoning', prompt_lang)]
+    lang_names = LANG_NAMES[prompt_lang]
+
+    prompt_prefix = build_exemplar_prefix(exemplar_dataset, num_exemplar, templates['exemplar'],
+                                          lang=lang_names.get(eval_lang, eval_lang))
+    
+    # 样本语言通常与评估语言相同，预先代入语言名称，只有不同时才重新代入
+    eval_query = bind_template(templates['query'], lang=lang_names.get(eval_lang, eval_lang))
+
+    for item in input_dataset:
         qid = item['id']
 
         # 根据metadata中的language字段获取语言
-        if 'metadata' in item and 'language' in item['metadata']:
-            lang = item['metadata']['language']
-        else:
-            lang = eval_lang
+        meta = item.get('metadata') or EMPTY_METADATA
+        lang = meta.get('language', eval_lang)
             
-        prompt = prompt_prefix
-        if prompt_lang == 'en':
-            prompt += f"Solve the following {abbr_to_lang_en.get(lang, lang)} math problem and provide only the final numerical answer.\n"
-            prompt += f"Problem: {item['question']}\n"
-            prompt += f"Answer: "
-        elif prompt_lang == 'zh':
-            prompt += f"解决以下{abbr_to_lang_zh.get(lang, lang)}数学问题，并只提供最终的数字答案。\n"
-            prompt += f"问题：{item['question']}\n"
-            prompt += f"答案："
+        query = eval_query if lang == eval_lang else bind_template(templates['query'], lang=lang_names.get(lang, lang))
+        prompt = prompt_prefix + query.format(question=item['question'])
         
         converted_dataset.append({
             "id": qid,
@@ -974,51 +1119,29 @@ def convert_dataset_into_prompt_traditional_culture(input_dataset, exemplar_data
     """
     converted_dataset = []
     
-    # 添加不同语言的生成提示
-    language_prompts_zh = {
-        'bo': "",
-        'mn': "请使用传统蒙古语回答。",
-        'ug': ""
-    }
+    # 模板中的hints为不同语言的生成提示
+    templates = PROMPT_TEMPLATES[('traditional_culture', prompt_lang)]
+    lang_names = LANG_NAMES[prompt_lang]
+    hints = templates['hints']
+
+    prompt_prefix = build_exemplar_prefix(exemplar_dataset, num_exemplar, templates['exemplar'],
+                                          lang=lang_names.get(eval_lang, eval_lang), hint=hints.get(eval_lang, ''))
     
-    language_prompts_en = {
-        'bo': "",
-        'mn': "Please answer in traditional Mongolian script.",
-        'ug': ""
-    }
+    # 样本语言通常与评估语言相同，预先代入语言名称与附加提示，只有不同时才重新代入
+    eval_query = bind_template(templates['query'], lang=lang_names.get(eval_lang, eval_lang), hint=hints.get(eval_lang, ''))
 
-    prompt_prefix = ""
-    if exemplar_dataset is not None:
-        for i in range(min(num_exemplar, len(exemplar_dataset))):
-            example = exemplar_dataset[i]
-            if prompt_lang == 'en':
-                prompt_prefix += f"Please answer the following {abbr_to_lang_en[eval_lang]} question. {language_prompts_en.get(eval_lang, '')}\n"
-                prompt_prefix += f"Question: {example['question']}\n"
-                prompt_prefix += f"Answer: {example['answer']}\n\n"
-            elif prompt_lang == 'zh':
-                prompt_prefix += f"请回答以下{abbr_to_lang_zh[eval_lang]}问题。{language_prompts_zh.get(eval_lang, '')}\n"
-                prompt_prefix += f"问题：{example['question']}\n"
-                prompt_prefix += f"答案：{example['answer']}\n\n"
-
-    for i in range(len(input_dataset)):
-        item = input_dataset[i]
+    for item in input_dataset:
         qid = item['id']
 
         # 根据metadata中的language字段获取语言
-        if 'metadata' in item and 'language' in item['metadata']:
-            lang = item['metadata']['language']
-        else:
-            lang = eval_lang
+        meta = item.get('metadata') or EMPTY_METADATA
+        lang = meta.get('language', eval_lang)
             
-        prompt = prompt_prefix
-        if prompt_lang == 'en':
-            prompt += f"Please answer the following {abbr_to_lang_en.get(lang, lang)} question. {language_prompts_en.get(lang, '')}\n"
-            prompt += f"Question: {item['question']}\n"
-            prompt += f"Answer: "
-        elif prompt_lang == 'zh':
-            prompt += f"请回答以下{abbr_to_lang_zh.get(lang, lang)}问题。{language_prompts_zh.get(lang, '')}\n"
-            prompt += f"问题：{item['question']}\n"
-            prompt += f"答案："
+        if lang == eval_lang:
+            query = eval_query
+        else:
+            query = bind_template(templates['query'], lang=lang_names.get(lang, lang), hint=hints.get(lang, ''))
+        prompt = prompt_prefix + query.format(question=item['question'])
         
         converted_dataset.append({
             "id": qid,
@@ -1044,51 +1167,29 @@ def convert_dataset_into_prompt_text_generation(input_dataset, exemplar_dataset=
     """
     converted_dataset = []
     
-    # 添加不同语言的生成提示
-    language_prompts_zh = {
-        'bo': "",
-        'mn': "请使用传统蒙古语。",
-        'ug': ""
-    }
+    # 模板中的hints为不同语言的生成提示
+    templates = PROMPT_TEMPLATES[('text_generation', prompt_lang)]
+    lang_names = LANG_NAMES[prompt_lang]
+    hints = templates['hints']
+
+    prompt_prefix = build_exemplar_prefix(exemplar_dataset, num_exemplar, templates['exemplar'],
+                                          lang=lang_names.get(eval_lang, eval_lang), hint=hints.get(eval_lang, ''))
     
-    language_prompts_en = {
-        'bo': "",
-        'mn': "Please answer in traditional Mongolian script.",
-        'ug': ""
-    }
+    # 样本语言通常与评估语言相同，预先代入语言名称与附加提示，只有不同时才重新代入
+    eval_query = bind_template(templates['query'], lang=lang_names.get(eval_lang, eval_lang), hint=hints.get(eval_lang, ''))
 
-    prompt_prefix = ""
-    if exemplar_dataset is not None:
-        for i in range(min(num_exemplar, len(exemplar_dataset))):
-            example = exemplar_dataset[i]
-            if prompt_lang == 'en':
-                prompt_prefix += f"Please answer the following {abbr_to_lang_en[eval_lang]} question. {language_prompts_en.get(eval_lang, '')}\n"
-                prompt_prefix += f"Question: {example['question']}\n"
-                prompt_prefix += f"Answer: {example['answer']}\n\n"
-            elif prompt_lang == 'zh':
-                prompt_prefix += f"请回答以下{abbr_to_lang_zh[eval_lang]}问题。{language_prompts_zh.get(eval_lang, '')}\n"
-                prompt_prefix += f"问题：{example['question']}\n"
-                prompt_prefix += f"回答：{example['answer']}\n\n"
-
-    for i in range(len(input_dataset)):
-        item = input_dataset[i]
+    for item in input_dataset:
         qid = item['id']
 
         # 根据metadata中的language字段获取语言
-        if 'metadata' in item and 'language' in item['metadata']:
-            lang = item['metadata']['language']
-        else:
-            lang = eval_lang
+        meta = item.get('metadata') or EMPTY_METADATA
+        lang = meta.get('language', eval_lang)
             
-        prompt = prompt_prefix
-        if prompt_lang == 'en':
-            prompt += f"Please answer the following {abbr_to_lang_en.get(lang, lang)} question. {language_prompts_en.get(lang, '')}\n"
-            prompt += f"Question: {item['question']}\n"
-            prompt += f"Answer: "
-        elif prompt_lang == 'zh':
-            prompt += f"请回答以下{abbr_to_lang_zh.get(lang, lang)}问题。{language_prompts_zh.get(lang, '')}\n"
-            prompt += f"问题：{item['question']}\n"
-            prompt += f"回答："
+        if lang == eval_lang:
+            query = eval_query
+        else:
+            query = bind_template(templates['query'], lang=lang_names.get(lang, lang), hint=hints.get(lang, ''))
+        prompt = prompt_prefix + query.format(question=item['question'])
         
         converted_dataset.append({
             "id": qid,
@@ -1113,55 +1214,28 @@ def convert_dataset_into_prompt_ethnic_language_understanding(input_dataset, exe
         转换后的带有提示的示例列表
     """
     converted_dataset = []
+    
+    templates = PROMPT_TEMPLATES[('ethnic_language_understanding', prompt_lang)]
+    lang_names = LANG_NAMES[prompt_lang]
 
-    prompt_prefix = ""
-    if exemplar_dataset is not None:
-        for i in range(min(num_exemplar, len(exemplar_dataset))):
-            example = exemplar_dataset[i]
-            # 处理选项，添加A、B、C等编号
-            options_text = ""
-            for j, option in enumerate(example['option']):
-                option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-                options_text += f"{option_label}. {option} "
-            
-            if prompt_lang == 'en':
-                prompt_prefix += f"Please answer the following {abbr_to_lang_en[eval_lang]} ethnic language understanding question by selecting the correct option.\n"
-                prompt_prefix += f"Question: {example['question']}\n"
-                prompt_prefix += f"Options: {options_text}\n"
-                prompt_prefix += f"Answer (just provide the letter of the option, e.g. A, B, C): {example['answer']}\n\n"
-            elif prompt_lang == 'zh':
-                prompt_prefix += f"请回答以下{abbr_to_lang_zh[eval_lang]}民族语言理解问题，选择正确的选项。\n"
-                prompt_prefix += f"问题：{example['question']}\n"
-                prompt_prefix += f"选项：{options_text}\n"
-                prompt_prefix += f"答案（只需提供选项字母，如A、B、C）：{example['answer']}\n\n"
-
-    for i in range(len(input_dataset)):
-        item = input_dataset[i]
+    prompt_prefix = build_exemplar_prefix(exemplar_dataset, num_exemplar, templates['exemplar'], with_options=True,
+                                          lang=lang_names.get(eval_lang, eval_lang))
+    
+    # 样本语言通常与评估语言相同，预先代入语言名称，只有不同时才重新代入
+    eval_query = bind_template(templates['query'], lang=lang_names.get(eval_lang, eval_lang))
+
+    for item in input_dataset:
         qid = item['id']
 
         # 根据metadata中的language字段获取语言
-        if 'metadata' in item and 'language' in item['metadata']:
-            lang = item['metadata']['language']
-        else:
-            lang = eval_lang
+        meta = item.get('metadata') or EMPTY_METADATA
+        lang = meta.get('language', eval_lang)
             
         # 处理选项，添加A、B、C等编号
-        options_text = ""
-        for j, option in enumerate(item['option']):
-            option_label = chr(65 + j)  # 65是ASCII码中'A'的值
-            options_text += f"{option_label}. {option} "
+        options_text = format_options(item['option'])
             
-        prompt = prompt_prefix
-        if prompt_lang == 'en':
-            prompt += f"Please answer the following {abbr_to_lang_en.get(lang, lang)} ethnic language understanding question by selecting the correct option.\n"
-            prompt += f"Question: {item['question']}\n"
-            prompt += f"Options: {options_text}\n"
-            prompt += f"Answer (just provide the letter of the option, e.g. A, B, C): "
-        elif prompt_lang == 'zh':
-            prompt += f"请回答以下{abbr_to_lang_zh.get(lang, lang)}民族语言理解问题，选择正确的选项。\n"
-            prompt += f"问题：{item['question']}\n"
-            prompt += f"选项：{options_text}\n"
-            prompt += f"答案（只需提供选项字母，如A、B、C）："
+        query = eval_query if lang == eval_lang else bind_template(templates['query'], lang=lang_names.get(lang, lang))
+        prompt = prompt_prefix + query.format(question=item['question'], options=options_text)
         
         converted_dataset.append({
             "id": qid,
@@ -1171,279 +1245,794 @@ def convert_dataset_into_prompt_ethnic_language_understanding(input_dataset, exe
     
     return converted_dataset
 
-def process_task(model, args):
-    """处理单个任务 - 修正版"""
-    print(f"===== 处理任务: {args.task} 语言: {args.eval_lang} =====")
+# 任务名称 -> 提示转换函数
+PROMPT_CONVERTERS = {
+    'translation': convert_dataset_into_prompt_translation,
+    'coref_resolution': convert_dataset_into_prompt_coref_resolution,
+    'entailment': convert_dataset_into_prompt_entailment,
+    'text_classification': convert_dataset_into_prompt_text_classification,
+    'reading_comprehension': convert_dataset_into_prompt_reading_comprehension,
+    'safety': convert_dataset_into_prompt_safety,
+    'professional_skills': convert_dataset_into_prompt_professional_skills,
+    'ethnic_vocabulary': convert_dataset_into_prompt_ethnic_vocabulary,
+    'math_reasoning': convert_dataset_into_prompt_math_reasoning,
+    'traditional_culture': convert_dataset_into_prompt_traditional_culture,
+    'text_generation': convert_dataset_into_prompt_text_generation,
+    'ethnic_language_understanding': convert_dataset_into_prompt_ethnic_language_understanding,
+    'ethnic_domain_knowledge': convert_dataset_into_prompt_ethnic_domain_knowledge,
+}
+
+# 样本数超过该阈值时，将数据集分块后在多个进程中并行转换提示
+CONVERT_PARALLEL_THRESHOLD = 50_000
+
+def convert_dataset_parallel(converter, input_dataset, exemplar_dataset, converter_kwargs):
+    """
+    将数据集按CPU核数分块，用多个进程并行调用转换函数，再按原顺序拼接结果
+
+    参数:
+        converter: 提示转换函数（模块级函数，可被pickle）
+        input_dataset: 要转换的数据集
+        exemplar_dataset: 示例数据集，可为None
+        converter_kwargs: 传给转换函数的其余参数
+
+    返回:
+        转换后的数据集
+    """
+    num_workers = os.cpu_count() or 1
+    chunk_size = -(-len(input_dataset) // num_workers)
+    chunks = [input_dataset[i:i + chunk_size] for i in range(0, len(input_dataset), chunk_size)]
+    converted_dataset = []
+    with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+        for part in executor.map(partial(converter, exemplar_dataset=exemplar_dataset, **converter_kwargs), chunks):
+            converted_dataset.extend(part)
+    return converted_dataset
+
+def is_task_complete(task, settings):
+    """
+    检查任务的输出文件是否已包含输入中所有样本的结果，只读取ID，不构建提示
+
+    参数:
+        task: 任务配置（TaskConfig）
+        settings: 所有任务共用的命令行参数
+
+    返回:
+        已完成返回True；输出文件不存在或无法读取时返回False
+    """
+    try:
+        with open(task.output_file, 'rb') as f:
+            done_ids = {item['id'] for item in orjson.loads(f.read())}
+        with open(task.input_file, 'rb') as f:
+            input_dataset = orjson.loads(f.read())
+    except Exception:
+        return False
+    # 调试模式下只需完成前max_test_example_num个样本
+    if settings.max_test_example_num > 0:
+        input_dataset = input_dataset[:settings.max_test_example_num]
+    # 阅读理解数据以query_id作为样本ID，与提示转换时一致
+    return all((item['query_id'] if 'query_id' in item else item.get('id')) in done_ids for item in input_dataset)
+
+def prepare_task(task, settings):
+    """
+    准备单个任务：读取已有结果用于断点续传，加载并转换数据集，筛选出尚未处理的样本
+
+    参数:
+        task: 任务配置（TaskConfig）
+        settings: 所有任务共用的命令行参数
+
+    返回:
+        任务状态字典；任务已完成或出错时返回None
+    """
+    print(f"===== 处理任务: {task.task} 语言: {task.eval_lang} =====")
     
     # 获取输出目录
-    output_folder = '/'.join(args.output_file.split('/')[:-1])
+    output_folder = '/'.join(task.output_file.split('/')[:-1])
     if len(output_folder) == 0:
         output_folder = '.'
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
+    os.makedirs(output_folder, exist_ok=True)
     
     # 创建错误日志和ID文件路径
-    base_name = os.path.splitext(args.output_file)[0]
+    base_name = os.path.splitext(task.output_file)[0]
     error_log_file = f"{base_name}_errors.log"
     error_id_file = f"{base_name}_error_ids.json"
     checkpoint_file = f"{base_name}_checkpoint.json"  # 新增检查点文件路径
+    results_jsonl_file = f"{base_name}_results.jsonl"  # 运行中追加写入的结果
     
     # 已处理的ID列表
     processed_ids = set()
     existing_results = []
+    unsaved_results = False  # 是否有只保存在检查点或追加结果文件中、尚未写入输出文件的结果
     
-    # 检查是否存在输出文件或检查点文件，用于断点续传
-    if os.path.exists(args.output_file):
-        try:
-            with open(args.output_file, 'r', encoding='utf-8') as f:
-                existing_results = json.load(f)
-                for item in existing_results:
-                    processed_ids.add(item['id'])
-            print(f"找到现有结果文件，已处理 {len(processed_ids)} 个样本")
-        except Exception as e:
-            print(f"读取现有结果文件时出错: {str(e)}")
-            # 文件可能损坏，重命名并重新开始
-            backup_file = f"{args.output_file}.bak.{int(time.time())}"
-            os.rename(args.output_file, backup_file)
-            print(f"已将可能损坏的结果文件备份为 {backup_file}")
-            existing_results = []
-    elif os.path.exists(checkpoint_file):
+    # 检查是否存在输出文件或检查点文件，用于断点续传；直接打开文件，不存在时再回退
+    try:
+        with open(task.output_file, 'rb') as f:
+            existing_results = orjson.loads(f.read())
+            for item in existing_results:
+                processed_ids.add(item['id'])
+        print(f"找到现有结果文件，已处理 {len(processed_ids)} 个样本")
+    except FileNotFoundError:
+        # 没有输出文件时尝试从检查点恢复
         try:
-            with open(checkpoint_file, 'r', encoding='utf-8') as f:
-                checkpoint_data = json.load(f)
+            with open(checkpoint_file, 'rb') as f:
+                checkpoint_data = orjson.loads(f.read())
                 processed_ids = set(checkpoint_data['processed_ids'])
                 if 'results' in checkpoint_data:
                     existing_results = checkpoint_data['results']
+                    unsaved_results = bool(existing_results)
             print(f"找到检查点文件，已处理 {len(processed_ids)} 个样本")
+        except FileNotFoundError:
+            pass
         except Exception as e:
             print(f"读取检查点文件时出错: {str(e)}")
             # 检查点文件可能损坏，忽略并重新开始
             existing_results = []
             processed_ids = set()
+    except Exception as e:
+        print(f"读取现有结果文件时出错: {str(e)}")
+        # 文件可能损坏，重命名并重新开始
+        backup_file = f"{task.output_file}.bak.{int(time.time())}"
+        os.rename(task.output_file, backup_file)
+        print(f"已将可能损坏的结果文件备份为 {backup_file}")
+        existing_results = []
+    
+    # 合并上次运行中追加写入、尚未汇总到输出文件的结果
+    try:
+        appended_results = load_results_jsonl(results_jsonl_file)
+    except FileNotFoundError:
+        appended_results = None
+    except Exception as e:
+        print(f"读取追加结果文件时出错: {str(e)}")
+        appended_results = []
+    if appended_results is not None:
+        # 检查点中的进度可能已包含这些样本的ID，按已有结果去重
+        existing_ids = {item['id'] for item in existing_results}
+        recovered = 0
+        for item in appended_results:
+            if item['id'] not in existing_ids:
+                existing_results.append(item)
+                existing_ids.add(item['id'])
+                processed_ids.add(item['id'])
+                recovered += 1
+                unsaved_results = True
+        print(f"从追加结果文件中恢复 {recovered} 个样本")
 
     # 加载数据
     try:
-        input_dataset = json.load(open(args.input_file, 'r', encoding='utf-8'))
-        if args.exemplar_file and args.exemplar_file.lower() != "null":
-            exemplar_dataset = json.load(open(args.exemplar_file, 'r', encoding='utf-8'))
+        with open(task.input_file, 'rb') as f:
+            input_dataset = orjson.loads(f.read())
+        if task.exemplar_file and task.exemplar_file.lower() != "null":
+            with open(task.exemplar_file, 'rb') as f:
+                exemplar_dataset = orjson.loads(f.read())
         else:
             exemplar_dataset = None
     except Exception as e:
         log_error(error_log_file, error_id_file, "加载数据集时出错", e)
         print(f"加载数据集时出错: {str(e)}")
-        return
+        return None
 
     # 转换数据集
-    if args.prompt_lang not in ['en', 'zh']:
+    if task.prompt_lang not in ['en', 'zh']:
         log_error(error_log_file, error_id_file, "提示语言错误", ValueError("提示语言必须是'en'或'zh'"))
         print("错误: 提示语言必须是'en'或'zh'")
-        return
+        return None
 
     # 设置默认值
-    num_exemplar = 3  # 默认值
-    if hasattr(args, 'num_exemplar'):
-        num_exemplar = args.num_exemplar
+    num_exemplar = task.num_exemplar
         
     max_passage_len = 512  # 默认值
-    if hasattr(args, 'max_passage_len'):
-        max_passage_len = args.max_passage_len
+    if hasattr(settings, 'max_passage_len'):
+        max_passage_len = settings.max_passage_len
 
     # ⭐ --- 主要修改点在这里 --- ⭐
     # 根据任务类型转换数据集
     try:
         # 获取映射后的任务名称
-        mapped_task = TASK_MAPPING.get(args.task, args.task)
+        mapped_task = TASK_MAPPING.get(task.task, task.task)
 
-        # 使用更清晰的 if/elif 结构
+        converter = PROMPT_CONVERTERS.get(mapped_task)
+        if converter is None:
+            log_error(error_log_file, error_id_file, f"不支持的任务类型 {task.task} (映射为 {mapped_task})", ValueError(f"不支持的任务类型 {task.task}"))
+            print(f"错误: 不支持的任务类型 {task.task} (映射为 {mapped_task})")
+            return None
+        
+        # 翻译任务使用源/目标语言，其余任务使用评估语言
+        converter_kwargs = {'num_exemplar': num_exemplar, 'prompt_lang': task.prompt_lang}
         if mapped_task == 'translation':
-            converted_dataset = convert_dataset_into_prompt_translation(
-                input_dataset, exemplar_dataset, args.src_lang, args.tgt_lang, num_exemplar, prompt_lang=args.prompt_lang
-            )
-        elif mapped_task == 'coref_resolution':
-            converted_dataset = convert_dataset_into_prompt_coref_resolution(
-                input_dataset, exemplar_dataset, args.eval_lang, num_exemplar, prompt_lang=args.prompt_lang
-            )
-        elif mapped_task == 'entailment':
-            converted_dataset = convert_dataset_into_prompt_entailment(
-                input_dataset, exemplar_dataset, args.eval_lang, num_exemplar, prompt_lang=args.prompt_lang
-            )
-        elif mapped_task == 'text_classification':
-            converted_dataset = convert_dataset_into_prompt_text_classification(
-                input_dataset, exemplar_dataset, args.eval_lang, num_exemplar, max_passage_len, prompt_lang=args.prompt_lang
-            )
-        elif mapped_task == 'reading_comprehension':
-            converted_dataset = convert_dataset_into_prompt_reading_comprehension(
-                input_dataset, exemplar_dataset, args.eval_lang, num_exemplar, prompt_lang=args.prompt_lang
-            )
-
-        # ⭐ 修正后的安全任务处理逻辑 ⭐
-        elif mapped_task == 'safety':
-            converted_dataset = convert_dataset_into_prompt_safety(
-                input_dataset, exemplar_dataset, args.eval_lang, num_exemplar, prompt_lang=args.prompt_lang
-            )
-            
-        elif mapped_task == 'professional_skills':
-            converted_dataset = convert_dataset_into_prompt_professional_skills(
-                input_dataset, exemplar_dataset, args.eval_lang, num_exemplar, prompt_lang=args.prompt_lang
-            )
-        elif mapped_task == 'ethnic_vocabulary':
-            converted_dataset = convert_dataset_into_prompt_ethnic_vocabulary(
-                input_dataset, exemplar_dataset, args.eval_lang, num_exemplar, prompt_lang=args.prompt_lang
-            )
-        elif mapped_task == 'math_reasoning':
-            converted_dataset = convert_dataset_into_prompt_math_reasoning(
-                input_dataset, exemplar_dataset, args.eval_lang, num_exemplar, prompt_lang=args.prompt_lang
-            )
-        elif mapped_task == 'traditional_culture':
-            converted_dataset = convert_dataset_into_prompt_traditional_culture(
-                input_dataset, exemplar_dataset, args.eval_lang, num_exemplar, prompt_lang=args.prompt_lang
-            )
-        elif mapped_task == 'text_generation':
-            converted_dataset = convert_dataset_into_prompt_text_generation(
-                input_dataset, exemplar_dataset, args.eval_lang, num_exemplar, prompt_lang=args.prompt_lang
-            )
-        elif mapped_task == 'ethnic_language_understanding':
-            converted_dataset = convert_dataset_into_prompt_ethnic_language_understanding(
-                input_dataset, exemplar_dataset, args.eval_lang, num_exemplar, prompt_lang=args.prompt_lang
-            )
-        elif mapped_task == 'ethnic_domain_knowledge':
-            converted_dataset = convert_dataset_into_prompt_ethnic_domain_knowledge(
-                input_dataset, exemplar_dataset, args.eval_lang, num_exemplar, prompt_lang=args.prompt_lang
-            )
+            converter_kwargs.update(src_lang=task.src_lang, tgt_lang=task.tgt_lang)
         else:
-            log_error(error_log_file, error_id_file, f"不支持的任务类型 {args.task} (映射为 {mapped_task})", ValueError(f"不支持的任务类型 {args.task}"))
-            print(f"错误: 不支持的任务类型 {args.task} (映射为 {mapped_task})")
-            return
+            converter_kwargs['eval_lang'] = task.eval_lang
+        if mapped_task == 'text_classification':
+            converter_kwargs['max_passage_len'] = max_passage_len
+        
+        # 各样本的转换互不依赖，超大数据集分块并行转换
+        if len(input_dataset) > CONVERT_PARALLEL_THRESHOLD and (os.cpu_count() or 1) > 1:
+            converted_dataset = convert_dataset_parallel(converter, input_dataset, exemplar_dataset, converter_kwargs)
+        else:
+            converted_dataset = converter(input_dataset, exemplar_dataset, **converter_kwargs)
     except Exception as e:
         log_error(error_log_file, error_id_file, "转换数据集时出错", e)
         print(f"转换数据集时出错: {str(e)}")
         traceback.print_exc()  # 打印详细错误信息
-        return
+        return None
 
     # 调试模式下限制示例数量
-    if args.max_test_example_num > 0:
-        converted_dataset = converted_dataset[:args.max_test_example_num]
+    if settings.max_test_example_num > 0:
+        converted_dataset = converted_dataset[:settings.max_test_example_num]
 
     print("提示示例:", converted_dataset[0]['input'])
 
-    # 筛选出未处理的样本
-    filtered_dataset = []
-    for item in converted_dataset:
-        if item['id'] not in processed_ids:
-            filtered_dataset.append(item)
+    # 筛选出未处理的样本（用只读快照筛选，processed_ids在推理过程中继续更新）
+    done_ids = frozenset(processed_ids)
+    filtered_dataset = [item for item in converted_dataset if item['id'] not in done_ids]
+    
+    state = {
+        'task': task,
+        'settings': settings,
+        'pending': filtered_dataset,
+        'total': len(converted_dataset),
+        # 将之前处理过的结果作为起点
+        'output_results': existing_results.copy(),
+        'processed_ids': processed_ids,
+        'error_ids': [],  # 存储出错的ID
+        'error_log_file': error_log_file,
+        'error_id_file': error_id_file,
+        'checkpoint_file': checkpoint_file,
+        'results_jsonl_file': results_jsonl_file,
+        'start_time': time.time(),
+    }
     
     if len(filtered_dataset) == 0:
         print(f"所有 {len(converted_dataset)} 个样本已处理完成，无需继续")
-        return
+        # 上次运行中最终保存失败或被中断时，恢复出的结果还需写入输出文件
+        if unsaved_results:
+            finalize_task(state)
+        return None
     
     print(f"总共 {len(converted_dataset)} 个样本，其中 {len(filtered_dataset)} 个尚未处理")
+    return state
+
+# max_new_tokens -> SamplingParams，同一输出长度的任务共用一个实例
+SAMPLING_PARAMS_CACHE = {}
+
+def make_sampling_params(max_new_tokens):
+    """为VLLM设置采样参数，按max_new_tokens缓存复用"""
+    sampling_params = SAMPLING_PARAMS_CACHE.get(max_new_tokens)
+    if sampling_params is None:
+        sampling_params = SAMPLING_PARAMS_CACHE[max_new_tokens] = SamplingParams(
+            temperature=0.0,  # 使用确定性生成
+            max_tokens=max_new_tokens,
+            stop=None  # 可以根据需要设置停止标记
+        )
+    return sampling_params
+
+# 生成文本的第一行（不含换行符）
+FIRST_LINE_PATTERN = re.compile(r'[^\n]*')
+
+# 旧版流程中按提示长度排序的窗口大小（以批次数计），窗口之间保持原有顺序
+LENGTH_SORT_WINDOW = 32
+
+def sort_by_prompt_length(dataset, window):
+    """
+    在每个窗口内按提示长度稳定排序，使长度相近的提示落在同一批次
+    
+    参数:
+        dataset: 待推理的样本列表
+        window: 窗口大小（样本数）
     
-    # 将之前处理过的结果作为起点
-    output_results = existing_results.copy()
-    error_ids = []  # 存储出错的ID
-    start_time = time.time()
+    返回:
+        排序后的新列表
+    """
+    sorted_dataset = []
+    for i in range(0, len(dataset), window):
+        sorted_dataset.extend(sorted(dataset[i:i + window], key=lambda item: len(item['input'])))
+    return sorted_dataset
+
+def record_outputs(state, batch, outputs):
+    """将一批样本的生成结果写入任务状态"""
+    settings = state['settings']
+    for j, item in enumerate(batch):
+        try:
+            qid = item['id']
+            gold = item['gold']
+            
+            # VLLM只返回生成部分，取其第一行作为输出
+            generated_text = outputs[j].outputs[0].text.strip()
+            output = FIRST_LINE_PATTERN.match(generated_text).group(0)
+            
+            result_item = {
+                "id": qid,
+                "pred": output,
+                "gold": gold
+            }
+            
+            state['output_results'].append(result_item)
+            state['processed_ids'].add(qid)  # 标记为已处理
+
+            if settings.print_inference_result:
+                print(qid)
+                print("pred:", output)
+                print("gold:", gold)
+        except Exception as e:
+            # 处理单个样本的错误
+            qid = item['id']
+            state['error_ids'].append(qid)
+            log_error(state['error_log_file'], state['error_id_file'], f"处理样本 {qid} 时出错", e, [qid])
+            print(f"处理样本 {qid} 时出错: {str(e)}")
+
+def finalize_task(state):
+    """保存任务的最终结果并汇总出错ID"""
+    task = state['task']
+    output_results = state['output_results']
+    checkpoint_file = state['checkpoint_file']
+    error_ids = state['error_ids']
+    error_id_file = state['error_id_file']
+    
+    # 最后保存结果；保存失败时保留检查点和追加结果文件，以便下次运行时恢复
+    saved = True
+    if output_results:
+        saved = save_results(output_results, task.output_file)
+        if not saved:
+            log_error(state['error_log_file'], error_id_file, "保存最终结果失败，已保留检查点和追加结果文件",
+                      IOError(f"无法写入 {task.output_file}"))
+            # 合并推理的结果只在内存中，尝试追加到JSONL文件，下次运行时从中恢复（重复的ID在读取时去重）
+            try:
+                with open(state['results_jsonl_file'], 'ab') as f:
+                    write_results_jsonl(f, output_results, sync=True)
+            except Exception as e:
+                print(f"追加结果时出错: {str(e)}")
+    
+    if output_results and saved:
+        # 任务完成后，可以选择删除检查点文件
+        if os.path.exists(checkpoint_file):
+            try:
+                os.remove(checkpoint_file)
+                print(f"任务完成，检查点文件已删除")
+            except:
+                print(f"无法删除检查点文件，但这不影响结果")
+        
+        # 追加结果已汇总到输出文件，可以删除
+        if os.path.exists(state['results_jsonl_file']):
+            try:
+                os.remove(state['results_jsonl_file'])
+            except:
+                print(f"无法删除追加结果文件，但这不影响结果")
+
+    # 确保所有错误ID都已保存
+    if error_ids:
+        log_error(state['error_log_file'], error_id_file, "汇总出错ID", Exception("处理完成，汇总所有出错ID"), error_ids)
+    
+    end_time = time.time()
+    total_time = end_time - state['start_time']
+    print(f"总用时: {total_time:.2f}秒")
+    if saved:
+        print(f"已处理 {len(state['processed_ids'])} 个样本并保存到 {task.output_file}")
+    else:
+        print(f"已处理 {len(state['processed_ids'])} 个样本，但保存到 {task.output_file} 失败")
+    if error_ids:
+        print(f"本次运行中有 {len(error_ids)} 个样本出错，ID已保存到 {error_id_file}")
+
+def process_task(model, state, tokenizer=None):
+    """
+    逐个任务分批推理（旧版流程，通过 --per_task_legacy 启用）
+
+    参数:
+        model: VLLM模型
+        state: prepare_task返回的任务状态，为None时直接返回
+        tokenizer: 所有任务共用的分词器，不为None时在提交前批量分词
+    """
+    if state is None:
+        return
+    
+    task = state['task']
+    settings = state['settings']
+    # 结果按ID记录，批次顺序不影响正确性
+    filtered_dataset = sort_by_prompt_length(state['pending'], settings.batch_size * LENGTH_SORT_WINDOW)
+    output_results = state['output_results']
+    processed_ids = state['processed_ids']
+    saved_count = len(output_results)  # 已写入的结果数
     save_counter = 0
-    last_save_time = start_time
-    save_frequency = args.save_frequency if hasattr(args, 'save_frequency') else 5
+    last_save_time = state['start_time']
+    save_frequency = settings.save_frequency if hasattr(settings, 'save_frequency') else 5
     time_based_save = 300  # 每5分钟保存一次，不论处理了多少样本
     
-    # 为VLLM设置采样参数
-    sampling_params = SamplingParams(
-        temperature=0.0,  # 使用确定性生成
-        max_tokens=args.max_new_tokens,
-        stop=None  # 可以根据需要设置停止标记
-    )
+    sampling_params = make_sampling_params(task.max_new_tokens)
     
-    for i in tqdm(range(0, len(filtered_dataset), args.batch_size)):
-        batch = filtered_dataset[i:i + args.batch_size]
+    # 每个批次的结果都追加到JSONL文件，断点续传时从中恢复；save_frequency只控制落盘(fsync)的频率
+    # 写入在后台线程中进行，同一时间最多只有一次写入，不阻塞下一批次的推理
+    results_jsonl = open(state['results_jsonl_file'], 'ab')
+    io_pool = ThreadPoolExecutor(max_workers=1)
+    save_future = None
+    save_start = saved_count
+    
+    # VLLM的generate自带逐样本进度条，这里只按批次低频刷新
+    for i in tqdm(range(0, len(filtered_dataset), settings.batch_size), desc=f"{task.task}_{task.eval_lang}", mininterval=2.0):
+        batch = filtered_dataset[i:i + settings.batch_size]
         batch_ids = [item['id'] for item in batch]  # 当前批次的ID列表
         input_text_batch = [item['input'] for item in batch]
+        if tokenizer is not None:
+            input_text_batch = tokenize_prompts(tokenizer, input_text_batch)
         
         try:
             # 使用VLLM生成输出
             outputs = model.generate(input_text_batch, sampling_params)
-            
-            for j in range(len(batch)):
-                try:
-                    qid = batch[j]['id']
-                    gold = batch[j]['gold']
-                    
-                    # 获取生成的输出文本
-                    output_obj = outputs[j]
-                    generated_text = output_obj.outputs[0].text.strip()
-                    
-                    # 截取输入提示后的部分作为输出
-                    prompt_length = len(input_text_batch[j])
-                    output = generated_text.strip().split('\n')[0]
-                    
-                    result_item = {
-                        "id": qid,
-                        "pred": output,
-                        "gold": gold
-                    }
-                    
-                    output_results.append(result_item)
-                    processed_ids.add(qid)  # 标记为已处理
-
-                    if args.print_inference_result:
-                        print(qid)
-                        print("pred:", output)
-                        print("gold:", gold)
-                except Exception as e:
-                    # 处理单个样本的错误
-                    qid = batch[j]['id']
-                    error_ids.append(qid)
-                    log_error(error_log_file, error_id_file, f"处理样本 {qid} 时出错", e, [qid])
-                    print(f"处理样本 {qid} 时出错: {str(e)}")
+            record_outputs(state, batch, outputs)
         except Exception as e:
             # 处理整个批次的错误
-            error_ids.extend(batch_ids)
-            log_error(error_log_file, error_id_file, "处理批次时出错", e, batch_ids)
+            state['error_ids'].extend(batch_ids)
+            log_error(state['error_log_file'], state['error_id_file'], "处理批次时出错", e, batch_ids)
             print(f"处理批次时出错: {str(e)}")
             
             # 继续处理下一个批次，而不是退出
             continue
         
-        # 定期保存
+        # 定期落盘
         save_counter += 1
         current_time = time.time()
         should_save = (save_counter >= save_frequency) or (current_time - last_save_time >= time_based_save)
         
+        # 等待上一次写入完成，写入失败时从上次的位置重新追加
+        if save_future is not None:
+            try:
+                save_future.result()
+            except Exception as e:
+                print(f"追加结果时出错: {str(e)}")
+                saved_count = save_start
+        # 只追加尚未写入的新结果，完整的输出文件在任务结束时一次性写出
+        save_start = saved_count
+        saved_count = len(output_results)
+        save_future = io_pool.submit(write_results_jsonl, results_jsonl, output_results[save_start:saved_count], should_save)
+        
         if should_save:
-            save_results(output_results, args.output_file)
-            # 同时更新检查点文件
-            with open(checkpoint_file, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'processed_ids': list(processed_ids),
-                    'last_processed_index': i + len(batch),
-                    'results': output_results
-                }, f, indent=2)
-            print(f"已更新检查点，当前进度: {len(processed_ids)}/{len(converted_dataset)}")
+            print(f"已保存进度: {len(processed_ids)}/{state['total']}")
             save_counter = 0
             last_save_time = current_time
     
-    # 最后保存结果
-    if output_results:
-        save_results(output_results, args.output_file)
-        
-        # 任务完成后，可以选择删除检查点文件
-        if os.path.exists(checkpoint_file):
+    # 等待后台写入完成后再汇总结果
+    io_pool.shutdown(wait=True)
+    results_jsonl.close()
+    if save_future is not None and save_future.exception() is not None:
+        print(f"追加结果时出错: {str(save_future.exception())}")
+    finalize_task(state)
+
+def finalize_and_release(state):
+    """保存任务结果后释放其提示与结果，不必等到所有桶处理完"""
+    finalize_task(state)
+    state['pending'] = state['output_results'] = None
+
+def submit_prepare_tasks(executor, tasks, settings):
+    """
+    将各任务的数据加载与提示构建提交到进程池，使其与模型加载并行进行
+
+    参数:
+        executor: 进程池
+        tasks: TaskConfig列表
+        settings: 所有任务共用的命令行参数
+
+    返回:
+        task_futures: (任务配置, Future) 列表，顺序与tasks一致
+    """
+    return [(task, executor.submit(prepare_task, task, settings)) for task in tasks]
+
+def tokenize_prompts(tokenizer, prompts):
+    """
+    使用快速分词器批量分词，返回可直接提交给VLLM的token id提示
+
+    参数:
+        tokenizer: HuggingFace快速分词器
+        prompts: 提示文本列表
+
+    返回:
+        {"prompt_token_ids": [...]} 形式的提示列表
+    """
+    # 与VLLM内部对文本提示的编码方式一致（添加特殊token），批量调用可走Rust多线程路径
+    return [{"prompt_token_ids": ids} for ids in tokenizer(prompts)["input_ids"]]
+
+def get_max_model_len(model):
+    """读取VLLM引擎的上下文长度上限，无法获取时返回None"""
+    try:
+        return model.llm_engine.model_config.max_model_len
+    except AttributeError:
+        return None
+
+def check_output_count(outputs, prompts):
+    """检查VLLM返回的输出数与提交的提示数一致，不一致时抛出异常，避免输出与样本错位"""
+    if len(outputs) != len(prompts):
+        raise ValueError(f"VLLM返回 {len(outputs)} 个输出，与提交的 {len(prompts)} 个提示数量不一致")
+    return outputs
+
+def generate_with_fallback(model, prompts, sampling_params, group_keys, error_log_file):
+    """
+    合并提交一批提示；整体推理失败或输出数量不一致时按任务拆分重试，任务内仍失败时逐条重试，只有出错的提示记为失败
+
+    参数:
+        model: VLLM模型
+        prompts: 提示列表（文本或token id）
+        sampling_params: 采样参数
+        group_keys: 各提示所属任务的标识，用于按任务拆分重试
+        error_log_file: 全局错误日志文件路径
+
+    返回:
+        与prompts一一对应的列表，元素为VLLM的输出，推理失败的提示为对应的异常
+    """
+    if not prompts:
+        return []
+    try:
+        return check_output_count(model.generate(prompts, sampling_params), prompts)
+    except Exception as e:
+        log_global_error(error_log_file, "合并推理时出错，拆分后重试", e)
+    
+    positions = {}
+    for i, key in enumerate(group_keys):
+        positions.setdefault(key, []).append(i)
+    
+    results = [None] * len(prompts)
+    for indices in positions.values():
+        # 只有一个任务时，按任务重试与整体推理相同，直接逐条重试
+        if len(positions) > 1:
             try:
-                os.remove(checkpoint_file)
-                print(f"任务完成，检查点文件已删除")
-            except:
-                print(f"无法删除检查点文件，但这不影响结果")
+                outputs = check_output_count(model.generate([prompts[i] for i in indices], sampling_params), indices)
+                for i, output in zip(indices, outputs):
+                    results[i] = output
+                continue
+            except Exception as e:
+                log_global_error(error_log_file, "按任务推理时出错，逐条重试", e)
+        for i in indices:
+            try:
+                results[i] = check_output_count(model.generate([prompts[i]], sampling_params, use_tqdm=False), [i])[0]
+            except Exception as e:
+                results[i] = e
+    return results
 
-    # 确保所有错误ID都已保存
-    if error_ids:
-        log_error(error_log_file, error_id_file, "汇总出错ID", Exception("处理完成，汇总所有出错ID"), error_ids)
+# 合并推理时每次提交给VLLM的提示数上限，每块推理完成后追加保存结果
+MERGED_CHUNK_SIZE = 4096
+
+def process_tasks_batched(model, task_futures, error_log_file, pretokenize=True):
+    """
+    将所有任务的提示按max_new_tokens分桶合并，每桶分块提交给VLLM，由VLLM的连续批处理调度，每块结束后按任务拆分并追加保存结果
+
+    参数:
+        model: VLLM模型
+        task_futures: submit_prepare_tasks返回的 (任务配置, Future) 列表
+        error_log_file: 全局错误日志文件路径
+        pretokenize: 是否在提交前批量分词，直接传入token id
+    """
+    states = []
+    for task, future in task_futures:
+        try:
+            state = future.result()
+        except Exception as e:
+            log_global_error(error_log_file, f"准备任务 {task.task}_{task.eval_lang} 时出错", e)
+            continue
+        if state is not None:
+            states.append(state)
     
-    end_time = time.time()
-    total_time = end_time - start_time
-    print(f"总用时: {total_time:.2f}秒")
-    print(f"已处理 {len(processed_ids)} 个样本并保存到 {args.output_file}")
-    if error_ids:
-        print(f"本次运行中有 {len(error_ids)} 个样本出错，ID已保存到 {error_id_file}")
+    if not states:
+        print("所有任务均已处理完成，无需推理")
+        return
+    
+    tokenizer = model.get_tokenizer() if pretokenize else None
+    # 提交前先排除超过上下文长度上限的提示，避免其导致整块推理失败
+    max_model_len = get_max_model_len(model)
+    # 保存结果文件的后台线程
+    io_pool = ThreadPoolExecutor(max_workers=4)
+    save_futures = []
+    
+    # 按max_new_tokens分桶提交，避免短输出任务与长输出任务混在同一批中等待
+    bins = {}
+    for state in states:
+        bins.setdefault(state['task'].max_new_tokens, []).append(state)
+    
+    for max_new_tokens in sorted(bins):
+        bin_states = bins[max_new_tokens]
+        # 使用确定性生成，相同的提示输出相同，只需提交一次；
+        # 各提示所属的 (任务族, 任务序号)：任务族为映射后的任务名，如五个安全任务目录同属safety，同一任务的提示共用同一段示例前缀
+        unique_index = {}
+        unique_prompts = []
+        unique_groups = []
+        occurrences = []  # 各不同提示对应的 (任务序号, 样本) 列表
+        num_items = 0
+        for s, state in enumerate(bin_states):
+            group = (TASK_MAPPING.get(state['task'].task, state['task'].task), s)
+            for item in state['pending']:
+                k = unique_index.get(item['input'])
+                if k is None:
+                    k = unique_index[item['input']] = len(unique_prompts)
+                    unique_prompts.append(item['input'])
+                    unique_groups.append(group)
+                    occurrences.append([])
+                occurrences[k].append((s, item))
+                num_items += 1
+        
+        # 桶内按任务族、任务、提示长度排序后提交：同族提示共用模板开头，同一任务的提示共用示例前缀，
+        # 连续调度可提高前缀缓存命中，输出再按原顺序还原
+        order = sorted(range(len(unique_prompts)), key=lambda k: (unique_groups[k], len(unique_prompts[k])))
+        
+        print(f"max_new_tokens={max_new_tokens}: 共 {len(bin_states)} 个任务，{num_items} 个样本（{len(unique_prompts)} 个不同提示），合并提交推理")
+        sampling_params = make_sampling_params(max_new_tokens)
+        resumed_counts = [len(state['output_results']) for state in bin_states]  # 断点续传恢复的结果数
+        saved_counts = resumed_counts.copy()  # 已追加到JSONL文件的结果数
+        jsonl_files = {}
+        
+        # 分块提交，每块推理完成后即追加保存其结果，中断时最多损失一块
+        for start in range(0, len(order), MERGED_CHUNK_SIZE):
+            chunk = order[start:start + MERGED_CHUNK_SIZE]
+            chunk_prompts = [unique_prompts[k] for k in chunk]
+            if tokenizer is not None:
+                try:
+                    chunk_prompts = tokenize_prompts(tokenizer, chunk_prompts)
+                except Exception as e:
+                    # 分词失败时退回提交文本，由VLLM自行分词
+                    print(f"批量分词时出错，改为提交文本提示: {str(e)}")
+            
+            # 块内各提示的输出，推理失败的提示为对应的异常；提交前先排除超过上下文长度上限的提示，避免其导致整块推理失败
+            chunk_outputs = [None] * len(chunk)
+            submit_indices = []
+            for i, prompt in enumerate(chunk_prompts):
+                if max_model_len is not None and isinstance(prompt, dict) and len(prompt['prompt_token_ids']) >= max_model_len:
+                    chunk_outputs[i] = ValueError(f"提示长度 {len(prompt['prompt_token_ids'])} 超过模型上下文长度上限 {max_model_len}")
+                else:
+                    submit_indices.append(i)
+            if len(submit_indices) < len(chunk):
+                print(f"{len(chunk) - len(submit_indices)} 个提示超过模型上下文长度上限，记为出错")
+            
+            submit_outputs = generate_with_fallback(model, [chunk_prompts[i] for i in submit_indices], sampling_params,
+                                                    [unique_groups[chunk[i]] for i in submit_indices], error_log_file)
+            for i, output in zip(submit_indices, submit_outputs):
+                chunk_outputs[i] = output
+            
+            # 将输出拆分回各个任务
+            done = {}  # 任务序号 -> (样本列表, 输出列表)
+            failed = {}  # 任务序号 -> {异常: 出错的样本ID}，同一次失败的样本合并记录
+            for k, output in zip(chunk, chunk_outputs):
+                for s, item in occurrences[k]:
+                    if isinstance(output, Exception):
+                        failed.setdefault(s, {}).setdefault(id(output), (output, []))[1].append(item['id'])
+                    else:
+                        done_items, done_outputs = done.setdefault(s, ([], []))
+                        done_items.append(item)
+                        done_outputs.append(output)
+            for s, (done_items, done_outputs) in done.items():
+                record_outputs(bin_states[s], done_items, done_outputs)
+            for s, errors in failed.items():
+                state = bin_states[s]
+                for error, batch_ids in errors.values():
+                    state['error_ids'].extend(batch_ids)
+                    log_error(state['error_log_file'], state['error_id_file'], "处理样本时出错", error, batch_ids)
+            
+            # 追加本块的新结果并落盘，中断后由prepare_task从追加结果文件中恢复
+            for s in done:
+                state = bin_states[s]
+                try:
+                    if s not in jsonl_files:
+                        jsonl_files[s] = open(state['results_jsonl_file'], 'ab')
+                    write_results_jsonl(jsonl_files[s], state['output_results'][saved_counts[s]:], sync=True)
+                    saved_counts[s] = len(state['output_results'])
+                except Exception as e:
+                    print(f"追加结果时出错: {str(e)}")
+            print(f"已保存进度: {start + len(chunk)}/{len(order)}")
+        
+        for f in jsonl_files.values():
+            f.close()
+        
+        # 每个桶结束后即在后台线程中保存其任务结果，同时开始推理下一个桶
+        for s, state in enumerate(bin_states):
+            # 结果按提交顺序记录，恢复为样本原顺序，使输出文件与逐批推理一致
+            position = {}
+            for i, item in enumerate(state['pending']):
+                position.setdefault(item['id'], i)
+            state['output_results'][resumed_counts[s]:] = sorted(state['output_results'][resumed_counts[s]:],
+                                                                 key=lambda result: position[result['id']])
+            save_futures.append(io_pool.submit(finalize_and_release, state))
+    
+    io_pool.shutdown(wait=True)
+    for future in save_futures:
+        if future.exception() is not None:
+            log_global_error(error_log_file, "保存任务结果时出错", future.exception())
+
+@dataclass(slots=True)
+class TaskConfig:
+    """单个评测任务的配置，各任务共用的默认值定义为字段默认值；字段顺序即任务列表文件中的键顺序"""
+    task: str  # 原始任务目录名
+    eval_lang: str
+    prompt_lang: str
+    input_file: str
+    output_file: str
+    exemplar_file: Optional[str] = None
+    src_lang: Optional[str] = None  # 仅翻译任务使用
+    tgt_lang: Optional[str] = None
+    num_exemplar: int = 3
+    max_new_tokens: int = 512
+
+TASK_CONFIG_FIELDS = frozenset(field.name for field in fields(TaskConfig))
+
+def task_config_to_dict(task):
+    """转换为写入任务列表文件的字典，非翻译任务省略src_lang/tgt_lang"""
+    task_dict = asdict(task)
+    if task.src_lang is None and task.tgt_lang is None:
+        del task_dict['src_lang'], task_dict['tgt_lang']
+    return task_dict
+
+# 任务类别和对应的目录
+TASK_CATEGORIES = {
+    'Foundation_Tasks': [
+        'Coreference_Resolution',
+        'General_Domain_Competence', 
+        'Machine_Reading_Comprehension',
+        'Math_Reasoning',
+        'Natural_Language_Inference',
+        'Text_Classification'
+    ],
+    'Chinese_Minority_Knowledge_Tasks': [
+        'Minority_Culture_QA',
+        'Minority_Domain_Competence',
+        'Minority_Language_Expressions',
+        'Minority_Language_Instruction_QA',
+        'Minority_Language_Understanding',
+        'Minority_Machine_Translation'
+    ],
+    'Safety_Alignment_Tasks': [
+        'Commercial_Compliance_Check',
+        'Discrimination_Detection',
+        'Rights_Protection_Evaluation',
+        'Service_Safety_Evaluation',
+        'Value_Alignment_Assessment'
+    ]
+}
+
+# 翻译任务在每种评估语言上的 (源语言, 目标语言) 方向
+TRANSLATION_DIRECTIONS = {
+    'bo': [('zh', 'bo'), ('bo', 'zh')],
+    'mn': [('zh', 'mn'), ('mn', 'zh')], 
+    'ug': [('zh', 'ug'), ('ug', 'zh')]
+}
+
+# 根据任务类型设置不同的max_new_tokens，未列出的任务使用512
+MAX_TOKENS_MAP = {
+    'General_Domain_Competence': 20,
+    'Minority_Language_Expressions': 20,
+    'Minority_Domain_Competence': 20,
+    'Minority_Language_Understanding': 20,
+    'Math_Reasoning': 200,
+    'Machine_Reading_Comprehension': 200,
+    'Minority_Culture_QA': 200,
+    'Minority_Language_Instruction_QA': 1000,
+    'Text_Classification': 100,
+    'Natural_Language_Inference': 50,
+    'Coreference_Resolution': 50
+}
+
+def build_translation_tasks(task_dir, eval_lang, prompt_lang, input_file, output_dir):
+    """翻译任务：每种评估语言按两个翻译方向各生成一个任务"""
+    # 使用原始目录名作为task参数
+    return [TaskConfig(task_dir, eval_lang, prompt_lang, input_file,
+                       f"{output_dir}/{prompt_lang}-prompt_{src_lang}2{tgt_lang}_test.json",
+                       max_new_tokens=300, src_lang=src_lang, tgt_lang=tgt_lang)
+            for src_lang, tgt_lang in TRANSLATION_DIRECTIONS[eval_lang]]
+
+def build_safety_tasks(task_dir, eval_lang, prompt_lang, input_file, output_dir):
+    """安全任务：每个安全任务有独立的文件夹，只需输出简短的选项"""
+    return [TaskConfig(task_dir, eval_lang, prompt_lang, input_file,
+                       f"{output_dir}/{prompt_lang}-prompt_test.json", max_new_tokens=20)]
+
+def build_generic_tasks(task_dir, eval_lang, prompt_lang, input_file, output_dir):
+    """其他任务的通用配置，max_new_tokens按任务目录查表"""
+    return [TaskConfig(task_dir, eval_lang, prompt_lang, input_file,
+                       f"{output_dir}/{prompt_lang}-prompt_test.json",
+                       max_new_tokens=MAX_TOKENS_MAP.get(task_dir, 512))]
+
+# 按任务目录、再按任务类别选择任务构建函数，都未命中时使用通用配置
+TASK_DIR_BUILDERS = {
+    'Minority_Machine_Translation': build_translation_tasks,
+}
+CATEGORY_BUILDERS = {
+    'Safety_Alignment_Tasks': build_safety_tasks,
+}
+
+# 所有 (任务类别, 任务目录, 构建函数)，按TASK_CATEGORIES中的顺序排列
+TASK_DIR_ENTRIES = [
+    (category, task_dir, TASK_DIR_BUILDERS.get(task_dir) or CATEGORY_BUILDERS.get(category, build_generic_tasks))
+    for category, task_dirs in TASK_CATEGORIES.items()
+    for task_dir in task_dirs
+]
 
 def generate_task_list(base_path, model_name, prompt_lang='zh', langs=['bo', 'mn', 'ug']):
     """
@@ -1456,126 +2045,172 @@ def generate_task_list(base_path, model_name, prompt_lang='zh', langs=['bo', 'mn
         langs: 评估语言列表
     
     返回:
-        tasks: 任务配置列表
+        tasks: TaskConfig列表
     """
     tasks = []
     output_base = f"{base_path}/output/{model_name}"
     
-    # 定义任务类别和对应的目录
-    task_categories = {
-        'Foundation_Tasks': [
-            'Coreference_Resolution',
-            'General_Domain_Competence', 
-            'Machine_Reading_Comprehension',
-            'Math_Reasoning',
-            'Natural_Language_Inference',
-            'Text_Classification'
-        ],
-        'Chinese_Minority_Knowledge_Tasks': [
-            'Minority_Culture_QA',
-            'Minority_Domain_Competence',
-            'Minority_Language_Expressions',
-            'Minority_Language_Instruction_QA',
-            'Minority_Language_Understanding',
-            'Minority_Machine_Translation'
-        ],
-        'Safety_Alignment_Tasks': [
-            'Commercial_Compliance_Check',
-            'Discrimination_Detection',
-            'Rights_Protection_Evaluation',
-            'Service_Safety_Evaluation',
-            'Value_Alignment_Assessment'
-        ]
-    }
+    # 为每个语言和任务生成配置（语言在外层，与逐层嵌套循环的顺序一致）
+    for eval_lang, (category, task_dir, builder) in itertools.product(langs, TASK_DIR_ENTRIES):
+        input_file = f"{base_path}/{category}/{task_dir}/{eval_lang}.json"
+        
+        # 检查文件是否存在
+        if not os.path.exists(input_file):
+            print(f"警告: 文件不存在 {input_file}")
+            continue
+        
+        # 输出目录使用原始目录名，同一 (任务目录, 评估语言) 下的各任务共用
+        output_dir = f"{output_base}/{task_dir}/{eval_lang}"
+        tasks.extend(builder(task_dir, eval_lang, prompt_lang, input_file, output_dir))
     
-    # 特殊处理翻译任务
-    translation_configs = {
-        'bo': [('zh', 'bo'), ('bo', 'zh')],
-        'mn': [('zh', 'mn'), ('mn', 'zh')], 
-        'ug': [('zh', 'ug'), ('ug', 'zh')]
-    }
+    return tasks
+
+def restrict_visible_devices(num_gpus):
+    """
+    只向VLLM暴露张量并行所需的GPU，避免其在启动时探测节点上所有可见的GPU
+
+    参数:
+        num_gpus: 需要的GPU数量
+    """
+    visible_devices = os.environ.get('CUDA_VISIBLE_DEVICES')
+    if visible_devices is None:
+        # 未指定时使用前num_gpus张GPU，与VLLM默认选用的设备一致
+        os.environ['CUDA_VISIBLE_DEVICES'] = ','.join(str(i) for i in range(num_gpus))
+        return
+    devices = [device.strip() for device in visible_devices.split(',') if device.strip()]
+    if len(devices) > num_gpus:
+        os.environ['CUDA_VISIBLE_DEVICES'] = ','.join(devices[:num_gpus])
+
+def run_tasks(args, tasks, error_log_file):
+    """
+    加载模型并推理给定的任务
+
+    参数:
+        args: 命令行参数，同时作为所有任务共用的设置
+        tasks: TaskConfig列表
+        error_log_file: 全局错误日志文件路径
+    """
+    # 合并推理时，在加载模型的同时用进程池并行准备各任务的提示
+    executor = None
+    if not args.per_task_legacy and tasks:
+        executor = ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, len(tasks)))
+        task_futures = submit_prepare_tasks(executor, tasks, args)
     
-    # 为每个语言和任务生成配置
-    for eval_lang in langs:
-        for category, task_dirs in task_categories.items():
-            for task_dir in task_dirs:
-                input_file = f"{base_path}/{category}/{task_dir}/{eval_lang}.json"
-                
-                # 检查文件是否存在
-                if not os.path.exists(input_file):
-                    print(f"警告: 文件不存在 {input_file}")
-                    continue
-                
-                # 获取映射的任务名称（仅用于任务处理逻辑）
-                mapped_task = TASK_MAPPING.get(task_dir, task_dir)
-                
-                # 特殊处理翻译任务
-                if task_dir == 'Minority_Machine_Translation':
-                    for src_lang, tgt_lang in translation_configs[eval_lang]:
-                        # 使用原始目录名作为输出路径
-                        output_file = f"{output_base}/{task_dir}/{eval_lang}/{prompt_lang}-prompt_{src_lang}2{tgt_lang}_test.json"
-                        
-                        task_config = {
-                            "task": task_dir,  # 使用原始目录名作为task参数
-                            "eval_lang": eval_lang,
-                            "prompt_lang": prompt_lang,
-                            "input_file": input_file,
-                            "output_file": output_file,
-                            "exemplar_file": None,
-                            "src_lang": src_lang,
-                            "tgt_lang": tgt_lang,
-                            "num_exemplar": 3,
-                            "max_new_tokens": 300
-                        }
-                        tasks.append(task_config)
-                # 特殊处理安全任务 - 每个安全任务有独立的文件夹
-                elif category == 'Safety_Alignment_Tasks':
-                    # 使用原始目录名作为输出路径
-                    output_file = f"{output_base}/{task_dir}/{eval_lang}/{prompt_lang}-prompt_test.json"
-                    
-                    task_config = {
-                        "task": task_dir,  # 使用原始目录名作为task参数
-                        "eval_lang": eval_lang,
-                        "prompt_lang": prompt_lang,
-                        "input_file": input_file,
-                        "output_file": output_file,
-                        "exemplar_file": None,
-                        "num_exemplar": 3,
-                        "max_new_tokens": 20
-                    }
-                    tasks.append(task_config)
-                else:
-                    # 其他任务的通用配置 - 使用原始目录名作为输出路径
-                    output_file = f"{output_base}/{task_dir}/{eval_lang}/{prompt_lang}-prompt_test.json"
-                    
-                    # 根据任务类型设置不同的max_new_tokens
-                    max_tokens_map = {
-                        'General_Domain_Competence': 20,
-                        'Minority_Language_Expressions': 20,
-                        'Minority_Domain_Competence': 20,
-                        'Minority_Language_Understanding': 20,
-                        'Math_Reasoning': 200,
-                        'Machine_Reading_Comprehension': 200,
-                        'Minority_Culture_QA': 200,
-                        'Minority_Language_Instruction_QA': 1000,
-                        'Text_Classification': 100,
-                        'Natural_Language_Inference': 50,
-                        'Coreference_Resolution': 50
-                    }
-                    
-                    task_config = {
-                        "task": task_dir,  # 使用原始目录名作为task参数
-                        "eval_lang": eval_lang,
-                        "prompt_lang": prompt_lang,
-                        "input_file": input_file,
-                        "output_file": output_file,
-                        "exemplar_file": None,
-                        "num_exemplar": 3,
-                        "max_new_tokens": max_tokens_map.get(task_dir, 512)  # 注意这里也改为使用task_dir
-                    }
-                    tasks.append(task_config)
+    # 使用VLLM加载模型
+    restrict_visible_devices(args.tensor_parallel_size)
+    print(f"正在加载模型 {args.model_path}...")
+    try:
+        # 初始化VLLM模型
+        model = LLM(
+            model=args.model_path,
+            tensor_parallel_size=args.tensor_parallel_size,
+            gpu_memory_utilization=args.gpu_memory_utilization,
+            # 同一任务的提示都以相同的示例前缀开头，前缀缓存可复用其KV，避免重复预填充
+            enable_prefix_caching=not args.no_prefix_caching,
+            # 离线评测不关心首token延迟，放宽并发序列数让短输出任务更多地驻留在KV缓存中
+            max_num_seqs=args.max_num_seqs,
+            max_num_batched_tokens=args.max_num_batched_tokens,
+            # 较大的KV缓存块可减少分页开销
+            block_size=args.block_size,
+            max_model_len=args.max_model_len,
+            enforce_eager=args.enforce_eager,
+            swap_space=args.swap_space,
+            quantization=None if args.quantization == 'none' else args.quantization,
+            dtype=args.dtype,
+            trust_remote_code=True
+        )
+        print("模型加载完成")
+        # 以引擎实际采用的配置为准：VLLM对部分模型或量化方式会强制使用eager模式，与 --enforce_eager 无关
+        try:
+            enforce_eager = model.llm_engine.model_config.enforce_eager
+        except AttributeError:
+            enforce_eager = None
+        if enforce_eager is not None:
+            print("CUDA图: 已关闭，以eager模式执行" if enforce_eager else "CUDA图: 已启用")
+    except Exception as e:
+        log_global_error(error_log_file, "加载模型时出错", e)
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        return
     
-    return tasks
+    if not args.per_task_legacy:
+        # 合并所有任务的提示，一次性提交给VLLM
+        if executor is None:
+            print("任务列表为空，无需推理")
+            return
+        with executor:
+            process_tasks_batched(model, task_futures, error_log_file, pretokenize=not args.no_pretokenize)
+        return
+    
+    # 所有任务共用模型自带的分词器
+    tokenizer = None if args.no_pretokenize else model.get_tokenizer()
+    # 遍历处理所有任务：按max_new_tokens从小到大依次处理，同一输出长度的任务连续执行
+    tasks = sorted(tasks, key=lambda task: task.max_new_tokens)
+    # 推理当前任务时，在后台线程中预先读取并准备下一个任务
+    with ThreadPoolExecutor(max_workers=1) as prefetch_pool:
+        next_future = prefetch_pool.submit(prepare_task, tasks[0], args) if tasks else None
+        for i, task in enumerate(tqdm(tasks, desc="tasks")):
+            state_future = next_future
+            if i + 1 < len(tasks):
+                next_future = prefetch_pool.submit(prepare_task, tasks[i + 1], args)
+            try:
+                process_task(model, state_future.result(), tokenizer)
+            except Exception as e:
+                task_name = f"{task.task}_{task.eval_lang}"
+                log_global_error(error_log_file, f"处理任务 {task_name} 时出错", e)
+                continue
+
+def data_parallel_worker(args, tasks, error_log_file):
+    """数据并行的子进程入口，GPU已通过CUDA_VISIBLE_DEVICES限定"""
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    run_tasks(args, tasks, error_log_file)
+
+def run_data_parallel(args, tasks, error_log_file):
+    """
+    启动data_parallel_size个子进程，每个进程占用tensor_parallel_size张GPU并加载一个模型副本，
+    任务按序号轮流分配给各进程
+
+    参数:
+        args: 命令行参数
+        tasks: TaskConfig列表
+        error_log_file: 全局错误日志文件路径（各进程追加写入同一文件）
+    """
+    visible_devices = os.environ.get('CUDA_VISIBLE_DEVICES')
+    if visible_devices:
+        devices = [device.strip() for device in visible_devices.split(',') if device.strip()]
+    else:
+        devices = [str(i) for i in range(torch.cuda.device_count())]
+    
+    num_gpus = args.data_parallel_size * args.tensor_parallel_size
+    if len(devices) < num_gpus:
+        log_global_error(error_log_file, "启动数据并行时出错",
+                         ValueError(f"需要 {num_gpus} 张GPU，但只有 {len(devices)} 张可用"))
+        return
+    
+    # 子进程使用spawn启动，避免fork继承父进程中的CUDA状态；子进程启动时继承当前的环境变量
+    ctx = multiprocessing.get_context('spawn')
+    workers = []
+    try:
+        for rank in range(args.data_parallel_size):
+            worker_devices = devices[rank * args.tensor_parallel_size:(rank + 1) * args.tensor_parallel_size]
+            os.environ['CUDA_VISIBLE_DEVICES'] = ','.join(worker_devices)
+            worker = ctx.Process(target=data_parallel_worker,
+                                 args=(args, tasks[rank::args.data_parallel_size], error_log_file))
+            worker.start()
+            print(f"数据并行进程 {rank} 已启动，使用GPU {','.join(worker_devices)}")
+            workers.append(worker)
+    finally:
+        if visible_devices is None:
+            os.environ.pop('CUDA_VISIBLE_DEVICES', None)
+        else:
+            os.environ['CUDA_VISIBLE_DEVICES'] = visible_devices
+    
+    for rank, worker in enumerate(workers):
+        worker.join()
+        if worker.exitcode != 0:
+            log_global_error(error_log_file, f"数据并行进程 {rank} 异常退出",
+                             RuntimeError(f"退出码 {worker.exitcode}"))
 
 def main():
     parser = argparse.ArgumentParser(description="批量处理多个任务的推理脚本")
@@ -1589,17 +2224,32 @@ def main():
     
     # 可选：直接指定任务列表文件
     parser.add_argument('--task_list', type=str, help="任务列表JSON文件（可选，如果不提供将自动生成）")
+    parser.add_argument('--gen_tasks_only', action='store_true', help="只生成任务列表文件后退出，不加载模型（之后通过 --task_list 推理）")
     
     # 共享参数
-    parser.add_argument('--batch_size', type=int, default=1, help="批处理大小")
-    parser.add_argument('--save_frequency', type=int, default=5, help="每处理多少批次保存一次结果")
+    parser.add_argument('--batch_size', type=int, default=1, help=f"批处理大小（仅用于 --per_task_legacy 旧版流程；合并流程每次提交 {MERGED_CHUNK_SIZE} 个提示，由VLLM连续批处理调度）")
+    parser.add_argument('--save_frequency', type=int, default=5, help="每处理多少批次落盘一次结果（仅用于 --per_task_legacy 旧版流程；合并流程每推理完一块提示即追加保存）")
     parser.add_argument('--max_test_example_num', type=int, default=-1, help="测试样本数限制 (-1表示使用全部)")
     parser.add_argument('--print_inference_result', action='store_true', help="打印推理结果")
     parser.add_argument('--num_exemplar', type=int, default=3, help="示例数量")
     parser.add_argument('--gpu_memory_utilization', type=float, default=0.9, help="GPU内存使用率")
     parser.add_argument('--tensor_parallel_size', type=int, default=1, help="张量并行大小")
+    parser.add_argument('--data_parallel_size', type=int, default=1, help="数据并行大小：启动多个进程，每个进程加载一个模型副本并处理一部分任务（模型可放入单卡时优先于张量并行）")
+    parser.add_argument('--max_num_seqs', type=int, default=1024, help="VLLM每步最多同时调度的序列数（离线批量评测调大以提高吞吐）")
+    parser.add_argument('--max_num_batched_tokens', type=int, default=None, help="VLLM每步最多处理的token数（不指定时使用VLLM默认值，建议8192左右）")
+    parser.add_argument('--quantization', type=str, default='none', choices=['none', 'fp8', 'awq', 'gptq'],
+                        help="权重量化方式：fp8可在线量化（适用于H100等支持FP8的GPU），awq/gptq需使用对应的预量化模型；none保持原精度，用于对照")
+    parser.add_argument('--dtype', type=str, default='auto', help="模型计算精度，如auto、bfloat16、float16")
+    parser.add_argument('--block_size', type=int, default=32, help="VLLM KV缓存块大小（token数）")
+    parser.add_argument('--max_model_len', type=int, default=None, help="模型上下文长度上限（不指定时使用模型配置中的值）")
+    parser.add_argument('--enforce_eager', action='store_true', help="关闭CUDA图，始终以eager模式执行")
+    parser.add_argument('--swap_space', type=float, default=4, help="每张GPU可用于换出KV缓存的CPU内存大小（GiB），设为0则不占用CPU内存")
+    parser.add_argument('--no_prefix_caching', action='store_true', help="关闭VLLM自动前缀缓存（默认开启，用于复用同一任务中相同的示例前缀）")
+    parser.add_argument('--no_pretokenize', action='store_true', help="不预先批量分词，由VLLM逐条对提示文本分词")
     parser.add_argument('--prompt_lang', type=str, default='zh', choices=['zh', 'en'], help="提示语言")
     parser.add_argument('--langs', nargs='+', default=['bo', 'mn', 'ug'], help="评估语言列表")
+    parser.add_argument('--no_resume', action='store_true', help="不在加载模型前跳过输出文件已完整的任务")
+    parser.add_argument('--per_task_legacy', action='store_true', help="逐个任务分批推理，而不是合并所有任务的提示一次性提交")
     
     args = parser.parse_args()
     
@@ -1611,8 +2261,12 @@ def main():
     if args.task_list:
         # 从文件加载任务列表
         try:
-            with open(args.task_list, 'r', encoding='utf-8') as f:
-                tasks = json.load(f)
+            with open(args.task_list, 'rb') as f:
+                task_dicts = orjson.loads(f.read())
+            # 文件中可能缺少num_exemplar，使用命令行参数补齐；忽略TaskConfig之外的字段
+            tasks = [TaskConfig(**{'num_exemplar': args.num_exemplar,
+                                   **{k: v for k, v in task_config.items() if k in TASK_CONFIG_FIELDS}})
+                     for task_config in task_dicts]
         except Exception as e:
             print(f"加载任务列表时出错: {str(e)}")
             return
@@ -1621,71 +2275,45 @@ def main():
         model_name = os.path.basename(args.model_path)
         tasks = generate_task_list(args.dataset_path, model_name, args.prompt_lang, args.langs)
         
-        # 保存生成的任务列表
+        # 在加载模型之前保存生成的任务列表，之后的步骤出错时也可以用 --task_list 直接复用
         task_list_file = f"tasks_{model_name}_{args.prompt_lang}.json"
         try:
-            with open(task_list_file, 'w', encoding='utf-8') as f:
-                json.dump(tasks, f, indent=2, ensure_ascii=False)
+            with open(task_list_file, 'wb') as f:
+                f.write(orjson.dumps([task_config_to_dict(task) for task in tasks], option=orjson.OPT_INDENT_2))
             print(f"已生成任务列表文件: {task_list_file}")
         except Exception as e:
             print(f"保存任务列表时出错: {str(e)}")
+            if args.gen_tasks_only:
+                return
     
-    # 创建全局错误日志
-    error_log_file = f"global_errors_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
+    # 只生成任务列表时不加载模型，可在无GPU的节点上预先运行
+    if args.gen_tasks_only:
+        print(f"共 {len(tasks)} 个任务，已跳过推理")
+        return
     
-    # 使用VLLM加载模型
-    print(f"正在加载模型 {args.model_path}...")
-    try:
-        # 初始化VLLM模型
-        model = LLM(
-            model=args.model_path,
-            tensor_parallel_size=args.tensor_parallel_size,
-            gpu_memory_utilization=args.gpu_memory_utilization,
-            trust_remote_code=True
-        )
-        print("模型加载完成")
-    except Exception as e:
-        with open(error_log_file, 'a', encoding='utf-8') as f:
-            f.write(f"=== {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
-            f.write(f"加载模型时出错: {str(e)}\n")
-            f.write(f"堆栈跟踪:\n{traceback.format_exc()}\n\n")
-        print(f"加载模型时出错: {str(e)}")
+    # 断点续传：加载模型前跳过输出文件中已包含全部样本结果的任务
+    if not args.no_resume:
+        remaining_tasks = [task for task in tasks if not is_task_complete(task, args)]
+        if len(remaining_tasks) < len(tasks):
+            print(f"跳过 {len(tasks) - len(remaining_tasks)} 个已完成的任务，剩余 {len(remaining_tasks)} 个")
+        tasks = remaining_tasks
+    if not tasks:
+        print("所有任务均已处理完成，无需加载模型")
         return
     
-    # 遍历处理所有任务
-    for task_config in tasks:
-        # 确保任务配置中有num_exemplar参数
-        if 'num_exemplar' not in task_config:
-            task_config['num_exemplar'] = args.num_exemplar
-        
-        # 确保任务配置中有max_new_tokens参数
-        if 'max_new_tokens' not in task_config:
-            task_config['max_new_tokens'] = 512  # 设置默认值
-            
-        task_args = argparse.Namespace(
-            **task_config,
-            **{
-                'model_type': args.model_type,
-                'model_path': args.model_path,
-                'batch_size': args.batch_size,
-                'save_frequency': args.save_frequency,
-                'max_test_example_num': args.max_test_example_num,
-                'print_inference_result': args.print_inference_result,
-                'gpu_memory_utilization': args.gpu_memory_utilization,
-                'tensor_parallel_size': args.tensor_parallel_size
-            }
-        )
-        
-        try:
-            process_task(model, task_args)
-        except Exception as e:
-            task_name = f"{task_args.task}_{task_args.eval_lang}"
-            with open(error_log_file, 'a', encoding='utf-8') as f:
-                f.write(f"=== {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
-                f.write(f"处理任务 {task_name} 时出错: {str(e)}\n")
-                f.write(f"堆栈跟踪:\n{traceback.format_exc()}\n\n")
-            print(f"处理任务 {task_name} 时出错: {str(e)}")
-            continue
+    # 确定需要推理后再创建全局错误日志
+    error_log_file = f"global_errors_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
+    
+    # 在全局日志开头记录影响结果的模型配置，便于复现
+    with open(error_log_file, 'a', encoding='utf-8') as f:
+        f.write(f"=== {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
+        f.write(f"模型: {args.model_path} 量化: {args.quantization} 精度: {args.dtype}\n\n")
+    
+    # 数据并行：每组GPU加载一个模型副本，各自处理一部分任务
+    if args.data_parallel_size > 1:
+        run_data_parallel(args, tasks, error_log_file)
+    else:
+        run_tasks(args, tasks, error_log_file)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file